@@ -0,0 +1,198 @@
+# benchmark.py
+# Page-level benchmarks for the dashboard and the CSV import. Each nav page is
+# driven headlessly with Streamlit's AppTest, cold (all caches cleared) and
+# warm, recording wall time, SQL statement count and peak Python memory.
+#   python generate_data.py --db bench.db --patients 500000 --fresh
+#   python benchmark.py --db bench.db --out bench_baseline.json
+#   python benchmark.py --db bench.db --compare bench_baseline.json
+import sqlite3
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+PAGES = ["Dashboard", "Department Utilization", "Patient Analytics", "Cohort Analysis", "Data Filtering & Search",
+         "Staff Tools", "Hospital Admin", "About Us", "Contact Us"]
+APP = "smartcare_dashboard.py"
+TIMEOUT = 300  # seconds per script run
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# --- SQL statement counting ---
+# every connection the app opens gets a trace callback that bumps this counter
+# for statements run by the script thread; other threads aren't the page's cost
+statements = [0]
+_connect = sqlite3.connect
+
+
+def _count(sql):
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        statements[0] += 1
+
+
+def _counting_connect(*args, **kwargs):
+    conn = _connect(*args, **kwargs)
+    conn.set_trace_callback(_count)
+    return conn
+
+
+def clear_caches():
+    import streamlit as st
+    st.cache_resource.clear()
+    st.cache_data.clear()
+
+
+def run_page(at, page):
+    statements[0] = 0
+    start = time.perf_counter()
+    at.radio[0].set_value(page).run()
+    elapsed = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f"{page}: {at.exception[0].value}")
+    return elapsed, statements[0]
+
+
+def bench_pages(pages, repeats):
+    from streamlit.testing.v1 import AppTest
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    results = {}
+    for page in pages:
+        at = AppTest.from_file(os.path.join(HERE, APP), default_timeout=TIMEOUT)
+        at.run()
+        # peak memory of a cold render, measured on its own so tracing doesn't skew the timings
+        clear_caches()
+        tracemalloc.start()
+        run_page(at, page)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        clear_caches()
+        cold, cold_queries = run_page(at, page)
+        warm = [run_page(at, page) for _ in range(repeats)]
+        results[page] = {
+            "cold_seconds": round(cold, 4),
+            "cold_queries": cold_queries,
+            "warm_seconds": round(float(np.median([w[0] for w in warm])), 4),
+            "warm_queries": int(np.median([w[1] for w in warm])),
+            "peak_mb": round(peak / 1e6, 2),
+        }
+        print(f"{page:26s} cold {cold:7.3f}s / {cold_queries:4d} q   "
+              f"warm {results[page]['warm_seconds']:7.3f}s / {results[page]['warm_queries']:4d} q   "
+              f"peak {results[page]['peak_mb']:8.1f} MB")
+    return results
+
+
+def _import_once(path, db, traced=False):
+    import create_database
+    conn = _connect(db)
+    cur = conn.cursor()
+    create_database.create_schema(cur)
+    conn.commit()
+    create_database.migrate(conn)
+    create_database.create_beds(cur)
+    if traced:
+        tracemalloc.start()
+    stats = create_database.import_admissions(conn, path)
+    if traced:
+        stats["peak"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    conn.commit()
+    conn.close()
+    return stats
+
+
+def bench_import(rows):
+    # import a synthetic export of `rows` rows into scratch databases:
+    # once for the timing, once under tracemalloc for peak memory
+    import create_database
+    sample = pd.read_csv(os.path.join(HERE, create_database.CSV_FILE), dtype=str)
+    export = sample.iloc[np.arange(rows) % len(sample)].copy()
+    export["MRD No."] = np.arange(rows).astype(str)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "export.csv")
+        export.to_csv(path, index=False)
+        stats = _import_once(path, os.path.join(tmp, "timed.db"))
+        peak = _import_once(path, os.path.join(tmp, "traced.db"), traced=True)["peak"]
+    result = {"rows": rows, "seconds": round(stats["seconds"], 3),
+              "rows_per_sec": round(stats["rows_per_sec"]), "peak_mb": round(peak / 1e6, 2)}
+    print(f"{'CSV import':26s} {rows:,} rows in {result['seconds']:.2f}s "
+          f"({result['rows_per_sec']:,} rows/s), peak {result['peak_mb']:.1f} MB")
+    return result
+
+
+def compare(current, baseline):
+    print("\n--- change vs baseline (positive = slower / more)")
+    for page, now in current["pages"].items():
+        before = baseline.get("pages", {}).get(page)
+        if not before:
+            continue
+        deltas = []
+        for metric in ("cold_seconds", "warm_seconds", "cold_queries", "peak_mb"):
+            if before.get(metric):
+                deltas.append(f"{metric} {(now[metric] - before[metric]) / before[metric] * 100:+6.1f}%")
+        print(f"{page:26s} " + "   ".join(deltas))
+    if "import" in current and "import" in baseline:
+        change = (current["import"]["rows_per_sec"] - baseline["import"]["rows_per_sec"]) / baseline["import"]["rows_per_sec"]
+        print(f"{'CSV import':26s} rows_per_sec {change * 100:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SmartCare dashboard pages and the CSV import.")
+    parser.add_argument("--db", default=os.environ.get("SMARTCARE_DB", "hospital_data.db"))
+    parser.add_argument("--pages", nargs="*", default=PAGES)
+    parser.add_argument("--repeats", type=int, default=3, help="warm runs per page")
+    parser.add_argument("--import-rows", type=int, default=100_000, help="0 skips the import benchmark")
+    parser.add_argument("--out", help="write results as JSON (e.g. a new baseline)")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args()
+
+    # the app writes (migrations, WAL); benchmark a scratch copy, never the original
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "bench.db")
+        shutil.copy(args.db, db)
+        conn = _connect(db)
+        patients = conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+        beds = conn.execute("SELECT COUNT(*) FROM beddetails").fetchone()[0]
+        # the snapshot is brought up to date once, here, and the app's refresh thread is
+        # kept off: it would land in the traced memory of whichever page was running
+        import create_database
+        import snapshot
+        create_database.migrate(conn)
+        conn.close()
+        snapshot.refresh(db)
+        os.environ["SMARTCARE_SNAPSHOT_WORKER"] = "0"
+        os.environ["SMARTCARE_DB"] = db
+        os.chdir(HERE)  # the app loads logo.jpeg relative to the working directory
+        sqlite3.connect = _counting_connect
+        try:
+            pages = bench_pages(args.pages, args.repeats)
+        finally:
+            sqlite3.connect = _connect
+
+    results = {
+        "meta": {"db": args.db, "patients": patients, "beds": beds, "when": time.strftime("%Y-%m-%d %H:%M:%S"),
+                 "python": platform.python_version(), "sqlite": sqlite3.sqlite_version},
+        "pages": pages,
+    }
+    if args.import_rows:
+        results["import"] = bench_import(args.import_rows)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,112 +1,831 @@
 # create_database.py
 import sqlite3
-import csv
+import argparse
 import os
-from datetime import datetime
-
-DB_FILE = "hospital_data.db"
-
-conn = sqlite3.connect(DB_FILE)
-cur = conn.cursor()
-
-# --- Patients Table ---
-cur.execute("""
-CREATE TABLE IF NOT EXISTS patients (
-    sno INTEGER PRIMARY KEY AUTOINCREMENT,
-    mrd_no TEXT UNIQUE,
-    doa TEXT,
-    dod TEXT,
-    name TEXT,
-    age INTEGER,
-    gender TEXT,
-    department TEXT,
-    type_of_admission TEXT,
-    duration_of_stay REAL,
-    outcome TEXT,
-    smoking TEXT,
-    alcohol TEXT,
-    hb REAL,
-    tlc REAL,
-    platelets REAL,
-    glucose REAL,
-    anaemia TEXT,
-    heart_failure TEXT,
-    uti TEXT,
-    chest_infection TEXT
-)
-""")
-
-# --- Bed Details Table ---
-cur.execute("""
-CREATE TABLE IF NOT EXISTS beddetails (
-    bed_serial TEXT PRIMARY KEY,
-    department TEXT,
-    occupied TEXT DEFAULT 'NO',
-    patient_sno INTEGER,
-            
-    FOREIGN KEY(patient_sno) REFERENCES patients(sno)
-)
-""")
-
-# --- Users Table ---
-cur.execute("""
-CREATE TABLE IF NOT EXISTS users (
-    username TEXT PRIMARY KEY,
-    password TEXT,
-    role TEXT
-)
-""")
-
-# --- Create 50 beds per department ---
+import time
+from collections import defaultdict, deque
+
+import pandas as pd
+
+DB_FILE = os.environ.get("SMARTCARE_DB", "hospital_data.db")
+CSV_FILE = "Admissiondata.csv"
+CHUNK_SIZE = 50_000  # CSV rows per executemany batch
+ARCHIVE_AFTER_DAYS = 365  # closed encounters older than this move to patients_archive
+ARCHIVE_BATCH = 5_000     # rows moved per transaction
+SNAPSHOT_CHUNK = 65_536   # snos per columnar snapshot file (see snapshot.py)
+EVENTS_KEEP = 100_000     # change-feed events kept; older ones are pruned
+
 departments = ["General","ICU","Pediatrics","Maternity","Surgery"]
 bed_count = 50  # beds per department
+DEFAULT_DEPARTMENT = "General"  # the admission export has no ward column
+
+# --- Admission export header -> patients column ---
+CSV_COLUMNS = {
+    "MRD No.": "mrd_no",
+    "D.O.A": "doa",
+    "D.O.D": "dod",
+    "AGE": "age",
+    "GENDER": "gender",
+    "Department": "type_of_admission",  # E / O in the export
+    "DURATION OF STAY": "duration_of_stay",
+    "OUTCOME": "outcome",
+    "SMOKING": "smoking",
+    "ALCOHOL": "alcohol",
+    "HB": "hb",
+    "TLC": "tlc",
+    "PLATELETS": "platelets",
+    "GLUCOSE": "glucose",
+    "ANAEMIA": "anaemia",
+    "HEART FAILURE": "heart_failure",
+    "UTI": "uti",
+    "CHEST INFECTION": "chest_infection",
+}
+CSV_DATE_FORMAT = "%m/%d/%Y"  # 4/1/2017
+CSV_DAY_FIRST_FORMAT = "%d/%m/%Y"  # some export rows are day first: 1/4/2017 -> 3/4/2017, 3 days
+
+GENDERS = {"M": "Male", "F": "Female"}
+ADMISSION_TYPES = {"E": "Emergency", "O": "Routine"}
+OUTCOMES = {"DISCHARGE": "Discharged", "EXPIRY": "Deceased", "DAMA": "DAMA"}
+FLAG_COLUMNS = ["smoking", "alcohol", "anaemia", "heart_failure", "uti", "chest_infection"]
+LAB_COLUMNS = ["hb", "tlc", "platelets", "glucose"]
+
+
+# --- dates ---
+# doa / dod are stored as canonical text ("YYYY-MM-DD", or "YYYY-MM-DD HH:MM:SS"
+# when there is a time of day) next to integer epoch seconds in doa_ts / dod_ts.
+# Wall-clock times are stored as if they were UTC. Every write path goes through
+# normalize_dates(), so range filters and length of stay are plain integer maths.
+EPOCH = pd.Timestamp("1970-01-01")
+DAY_SECONDS = 86400
+
+
+def wall_clock_now():
+    # "now" on the same local wall clock as doa_ts / dod_ts, not time.time()'s UTC
+    return (pd.Timestamp.now() - EPOCH) // pd.Timedelta(seconds=1)
+
+
+def normalize_dates(df):
+    df = df.copy()
+    for col in ("doa", "dod"):
+        if col not in df:
+            continue
+        raw = df[col].astype("string").str.strip()
+        # ISO dates and datetimes (Staff Tools, admin edits) first, then 4/1/2017-style exports
+        parsed = pd.to_datetime(raw, format="ISO8601", errors="coerce")
+        parsed = parsed.fillna(pd.to_datetime(raw, format=CSV_DATE_FORMAT, errors="coerce")).dt.floor("s")
+        date_only = parsed == parsed.dt.normalize()
+        text = parsed.dt.strftime("%Y-%m-%d %H:%M:%S").where(~date_only, parsed.dt.strftime("%Y-%m-%d"))
+        # text we can't read is kept as entered, with a NULL *_ts, rather than dropped
+        df[col] = text.where(parsed.notna(), raw.mask(raw == ""))
+        df[f"{col}_ts"] = ((parsed - EPOCH) // pd.Timedelta(seconds=1)).astype("Int64")
+    if "doa_ts" in df and "dod_ts" in df:
+        # days in hospital counting both the admission and the discharge day, as the export does
+        df["duration_of_stay"] = df["dod_ts"] // DAY_SECONDS - df["doa_ts"] // DAY_SECONDS + 1
+    return df
+
+
+def sql_values(df):
+    # NaN / NaT / NA -> None and numpy scalars -> Python objects, ready for executemany
+    return df.astype(object).where(df.notna(), None)
+
+
+def normalize_record(record):
+    return sql_values(normalize_dates(pd.DataFrame([record]))).iloc[0].to_dict()
+
+
+def backfill_timestamps(conn):
+    df = pd.read_sql_query("SELECT sno, doa, dod FROM patients", conn)
+    df = sql_values(normalize_dates(df))
+    # the exported stay is kept; dod - doa only fills the gaps
+    conn.executemany("""
+        UPDATE patients SET doa = ?, dod = ?, doa_ts = ?, dod_ts = ?,
+                            duration_of_stay = COALESCE(duration_of_stay, ?)
+        WHERE sno = ?
+    """, df[["doa", "dod", "doa_ts", "dod_ts", "duration_of_stay", "sno"]].itertuples(index=False, name=None))
+    unread = int(((df["doa"].notna() & df["doa_ts"].isna()) | (df["dod"].notna() & df["dod_ts"].isna())).sum())
+    if unread:
+        print(f"⚠️ {unread} row(s) have a doa / dod that could not be read; the text is kept and *_ts left NULL")
+
+
+def recount_stays(conn):
+    # stays worked out from the timestamps used to count nights, not days: move those
+    # to the export's convention; anything else is an exported stay and stays as it is
+    for table in ("patients", "patients_archive"):
+        conn.execute(f"""
+            UPDATE {table} SET duration_of_stay = dod_ts / {DAY_SECONDS} - doa_ts / {DAY_SECONDS} + 1
+            WHERE dod_ts >= doa_ts AND duration_of_stay = (dod_ts - doa_ts) / {DAY_SECONDS}
+        """)
+
+
+# --- schema ---
+def create_schema(cur):
+    # --- Patients Table ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS patients (
+        sno INTEGER PRIMARY KEY AUTOINCREMENT,
+        mrd_no TEXT UNIQUE,
+        doa TEXT,
+        dod TEXT,
+        name TEXT,
+        age INTEGER,
+        gender TEXT,
+        department TEXT,
+        type_of_admission TEXT,
+        duration_of_stay REAL,
+        outcome TEXT,
+        smoking TEXT,
+        alcohol TEXT,
+        hb REAL,
+        tlc REAL,
+        platelets REAL,
+        glucose REAL,
+        anaemia TEXT,
+        heart_failure TEXT,
+        uti TEXT,
+        chest_infection TEXT
+    )
+    """)
+
+    # --- Bed Details Table ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS beddetails (
+        bed_serial TEXT PRIMARY KEY,
+        department TEXT,
+        occupied TEXT DEFAULT 'NO',
+        patient_sno INTEGER,
+
+        FOREIGN KEY(patient_sno) REFERENCES patients(sno)
+    )
+    """)
+
+    # --- Users Table ---
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        password TEXT,
+        role TEXT
+    )
+    """)
+
+
+def bed_prefix(department):
+    # BED-GEN-001: serials are numbered per prefix, which departments may share
+    return f"BED-{department.strip()[:3].upper()}"
+
+
+def create_beds(cur):
+    # --- Create 50 beds per department ---
+    cur.executemany(
+        "INSERT OR IGNORE INTO beddetails (bed_serial, department) VALUES (?,?)",
+        [(f"{bed_prefix(dept)}-{i:03d}", dept) for dept in departments for i in range(1, bed_count + 1)],
+    )
+
+
+def reserve_bed_serials(conn, department, n):
+    # Hands out the next n serials for the department's prefix; run it inside a
+    # write transaction. The counter lives in `sequences` and is first seeded
+    # from the highest suffix already in beddetails, and it never falls behind
+    # beds inserted directly (create_beds, generate_data.py), so serials are
+    # never reused.
+    prefix = bed_prefix(department)
+    last = conn.execute("""
+        INSERT INTO sequences (name, value)
+        SELECT :name, COALESCE(MAX(CAST(substr(bed_serial, :offset) AS INTEGER)), 0) + :n
+        FROM beddetails WHERE bed_serial GLOB :pattern
+        ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value - :n) + :n
+        RETURNING value
+    """, {"name": f"bed:{prefix}", "offset": len(prefix) + 2, "n": n, "pattern": f"{prefix}-[0-9]*"}).fetchall()[0][0]
+    return [f"{prefix}-{i:03d}" for i in range(last - n + 1, last + 1)]
+
+
+# --- department occupancy summary ---
+# department_occupancy is kept current by triggers on beddetails, so reading the
+# per-department totals never has to touch the beds themselves.
+OCCUPANCY_SQL = """
+    SELECT department, COUNT(*) AS total, SUM(occupied = 'YES') AS occupied
+    FROM beddetails GROUP BY department
+"""
+
+
+def rebuild_department_occupancy(conn):
+    conn.execute("DELETE FROM department_occupancy")
+    conn.execute(f"INSERT INTO department_occupancy (department, total, occupied) {OCCUPANCY_SQL}")
+
+
+def check_department_occupancy(conn, repair=True):
+    # compare the maintained summary with a full recount; returns the rows that drifted
+    expected = {d: (t, o) for d, t, o in conn.execute(OCCUPANCY_SQL)}
+    actual = {d: (t, o) for d, t, o in conn.execute(
+        "SELECT department, total, occupied FROM department_occupancy WHERE total > 0")}
+    drift = [{"department": d, "expected": expected.get(d, (0, 0)), "actual": actual.get(d, (0, 0))}
+             for d in sorted(set(expected) | set(actual), key=str)
+             if expected.get(d, (0, 0)) != actual.get(d, (0, 0))]
+    if drift and repair:
+        rebuild_department_occupancy(conn)
+    return drift
+
+
+# --- daily census rollup ---
+# daily_census holds admissions / discharges / deaths per day and department.
+# Triggers on patients add a row's contribution on insert, remove it on delete
+# and swap old for new on update, so any window is a short primary-key range scan.
+def _census_delta(row, sign):
+    return f"""
+        INSERT INTO daily_census (day, department, admissions)
+        SELECT date({row}.doa), IFNULL({row}.department, ''), {sign}
+        WHERE date({row}.doa) IS NOT NULL
+        ON CONFLICT (day, department) DO UPDATE SET admissions = admissions + excluded.admissions;
+        INSERT INTO daily_census (day, department, discharges, deaths)
+        SELECT date({row}.dod), IFNULL({row}.department, ''), {sign}, {sign} * ({row}.outcome IS 'Deceased')
+        WHERE date({row}.dod) IS NOT NULL
+        ON CONFLICT (day, department) DO UPDATE SET discharges = discharges + excluded.discharges,
+                                                    deaths = deaths + excluded.deaths;
+    """
+
+
+def _census_rows(table, where="true"):
+    return [f"""SELECT date(doa) AS day, IFNULL(department, '') AS department, 1 AS adm, 0 AS dis, 0 AS dead
+                FROM {table} WHERE {where} AND date(doa) IS NOT NULL""",
+            f"""SELECT date(dod), IFNULL(department, ''), 0, 1, outcome IS 'Deceased'
+                FROM {table} WHERE {where} AND date(dod) IS NOT NULL"""]
+
+
+def rebuild_daily_census(conn):
+    # the census covers archived encounters too
+    tables = ["patients"]
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'patients_archive'").fetchone():
+        tables.append("patients_archive")
+    parts = [part for table in tables for part in _census_rows(table)]
+    conn.execute("DELETE FROM daily_census")
+    conn.execute(f"""
+        INSERT INTO daily_census (day, department, admissions, discharges, deaths)
+        SELECT day, department, SUM(adm), SUM(dis), SUM(dead) FROM (
+            {" UNION ALL ".join(parts)}
+        ) GROUP BY day, department
+    """)
+
+
+def add_to_daily_census(conn, since_sno):
+    # fold in the patients rows after since_sno, one upsert per (day, department)
+    conn.execute(f"""
+        INSERT INTO daily_census (day, department, admissions, discharges, deaths)
+        SELECT day, department, SUM(adm), SUM(dis), SUM(dead) FROM (
+            {" UNION ALL ".join(_census_rows("patients", "sno > :since"))}
+        ) WHERE true GROUP BY day, department
+        ON CONFLICT (day, department) DO UPDATE SET admissions = admissions + excluded.admissions,
+                                                    discharges = discharges + excluded.discharges,
+                                                    deaths = deaths + excluded.deaths
+    """, {"since": since_sno})
+
+
+# --- archive ---
+# Closed encounters past ARCHIVE_AFTER_DAYS move from patients into
+# patients_archive, which has the same columns, so live reads and writes only
+# touch current inpatients and recent history. daily_census keeps counting
+# archived rows: its delete trigger skips a row that is already in the archive.
+# The search index covers live patients only.
+def create_archive(conn):
+    columns = conn.execute("PRAGMA table_info(patients)").fetchall()
+    defs = ", ".join("sno INTEGER PRIMARY KEY" if name == "sno" else f"{name} {ctype}"
+                     for _, name, ctype, *_ in columns)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS patients_archive ({defs})")
+
 
-for dept in departments:
-    for i in range(1, bed_count + 1):
-        bed_id = f"BED-{dept[:3].upper()}-{i:03d}"
-        cur.execute("INSERT OR IGNORE INTO beddetails (bed_serial, department) VALUES (?,?)", (bed_id, dept))
-
-# --- Import data from admission.csv if available and assign beds ---
-if os.path.exists("Admissiondat.csv"):
-    with open("Admissiondata.csv", newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            # Calculate duration_of_stay if DOA and DOD are present
-            duration = None
-            if row.get("doa") and row.get("dod"):
-                try:
-                    doa_date = datetime.strptime(row["doa"], "%Y-%m-%d")
-                    dod_date = datetime.strptime(row["dod"], "%Y-%m-%d")
-                    duration = (dod_date - doa_date).days
-                except Exception:
-                    duration = None
-            row["duration_of_stay"] = duration
-
-            # Ensure type_of_admission exists in row (default to "Routine" if missing)
-            if "type_of_admission" not in row or not row["type_of_admission"]:
-                row["type_of_admission"] = "Routine"
-
-            columns = ", ".join(row.keys())
-            placeholders = ", ".join("?" * len(row))
-            values = list(row.values())
-
-            # Insert patient
-            cur.execute(f"INSERT OR IGNORE INTO patients ({columns}) VALUES ({placeholders})", values)
-            patient_sno = cur.lastrowid
-
-            # Assign a free bed in the same department if available
+def archive_closed(conn, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH):
+    # one short BEGIN IMMEDIATE transaction per batch, so admissions and
+    # discharges get the write lock in between; a patient still linked to a
+    # bed always stays live
+    cutoff = wall_clock_now() - older_than_days * DAY_SECONDS
+    cols = ", ".join(row[1] for row in conn.execute("PRAGMA table_info(patients)"))
+    isolation = conn.isolation_level
+    conn.isolation_level = None
+    moved = 0
+    try:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (sno INTEGER PRIMARY KEY)")
+                conn.execute("DELETE FROM temp.archive_batch")
+                batch = conn.execute("""
+                    INSERT INTO temp.archive_batch
+                    SELECT sno FROM patients p
+                    WHERE dod_ts < ? AND NOT EXISTS (SELECT 1 FROM beddetails b WHERE b.patient_sno = p.sno)
+                    ORDER BY dod_ts LIMIT ?
+                """, (cutoff, batch_size)).rowcount
+                conn.execute(f"""INSERT INTO patients_archive ({cols})
+                                 SELECT {cols} FROM patients WHERE sno IN (SELECT sno FROM temp.archive_batch)""")
+                conn.execute("DELETE FROM patients WHERE sno IN (SELECT sno FROM temp.archive_batch)")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            moved += batch
+            if batch < batch_size:
+                break
+    finally:
+        conn.isolation_level = isolation
+    return moved
+
+
+# --- snapshot dirty tracking ---
+# snapshot.py keeps a columnar copy of these tables in chunks of SNAPSHOT_CHUNK
+# snos. Every write bumps its chunk's gen in snapshot_dirty; a refresh clears a
+# mark only if gen hasn't moved since it read the chunk.
+SNAPSHOT_TABLES = ["patients", "patients_archive", "beddetails"]
+SEED_SNAPSHOT_SQL = f"""
+    INSERT INTO snapshot_dirty (tbl, chunk)
+    SELECT * FROM (
+        SELECT 'patients', sno / {SNAPSHOT_CHUNK} FROM patients GROUP BY 2
+        UNION ALL SELECT 'patients_archive', sno / {SNAPSHOT_CHUNK} FROM patients_archive GROUP BY 2
+        UNION ALL SELECT 'beddetails', 0
+    ) WHERE true
+    ON CONFLICT (tbl, chunk) DO UPDATE SET gen = gen + 1
+"""
+
+
+def _snapshot_triggers():
+    steps = []
+    for table in SNAPSHOT_TABLES:
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            chunk = "0" if table == "beddetails" else f"{row}.sno / {SNAPSHOT_CHUNK}"
+            steps.append(f"""CREATE TRIGGER IF NOT EXISTS trg_snapshot_{table}_{event.lower()} AFTER {event} ON {table} BEGIN
+                   INSERT INTO snapshot_dirty (tbl, chunk) VALUES ('{table}', {chunk})
+                   ON CONFLICT (tbl, chunk) DO UPDATE SET gen = gen + 1;
+               END""")
+    return steps
+
+
+# --- change feed ---
+# events is an append-only log of admissions, discharges, edits and bed
+# changes, written by triggers in the same transaction as the change. Each
+# event carries the row's census fields before (old_*) and after the write, so
+# a reader holding totals as of event N reaches the current ones by applying
+# the events after N. Archive moves change no totals and log nothing; a bulk
+# import logs a single 'reload' event, after which readers start over.
+NOW_SQL = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+
+def _patient_image(row):
+    if row is None:
+        return "NULL, NULL, NULL, NULL"
+    return f"{row}.department, date({row}.doa), date({row}.dod), {row}.duration_of_stay"
+
+
+def _patient_event(kind, new=None, old=None):
+    return f"""
+        INSERT INTO events (at, kind, sno, department, doa, dod, los, old_department, old_doa, old_dod, old_los)
+        VALUES ({NOW_SQL}, {kind}, {new or old}.sno, {_patient_image(new)}, {_patient_image(old)});
+    """
+
+
+def _bed_event(new=None, old=None):
+    image = lambda row: f"{row}.department, {row}.occupied = 'YES'" if row else "NULL, NULL"
+    return f"""
+        INSERT INTO events (at, kind, sno, bed_serial, department, occupied, old_department, old_occupied)
+        VALUES ({NOW_SQL}, 'bed', {new or old}.patient_sno, {new or old}.bed_serial, {image(new)}, {image(old)});
+    """
+
+
+def _event_triggers():
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS trg_events_admit AFTER INSERT ON patients BEGIN
+               {_patient_event("'admit'", new="NEW")}
+           END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_events_patient_update AFTER UPDATE ON patients BEGIN
+               {_patient_event("CASE WHEN OLD.dod_ts IS NULL AND NEW.dod_ts IS NOT NULL THEN 'discharge' ELSE 'edit' END",
+                               new="NEW", old="OLD")}
+           END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_events_patient_delete AFTER DELETE ON patients
+           WHEN NOT EXISTS (SELECT 1 FROM patients_archive WHERE sno = OLD.sno) BEGIN
+               {_patient_event("'delete'", old="OLD")}
+           END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_events_bed_insert AFTER INSERT ON beddetails BEGIN
+               {_bed_event(new="NEW")}
+           END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_events_bed_update AFTER UPDATE ON beddetails
+           WHEN OLD.department IS NOT NEW.department OR OLD.occupied IS NOT NEW.occupied
+                OR OLD.patient_sno IS NOT NEW.patient_sno BEGIN
+               {_bed_event(new="NEW", old="OLD")}
+           END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_events_bed_delete AFTER DELETE ON beddetails BEGIN
+               {_bed_event(old="OLD")}
+           END""",
+        # keep the last EVENTS_KEEP events, trimmed every thousandth insert
+        f"""CREATE TRIGGER IF NOT EXISTS trg_events_prune AFTER INSERT ON events
+           WHEN NEW.id % 1000 = 0 BEGIN
+               DELETE FROM events WHERE id <= NEW.id - {EVENTS_KEEP};
+           END""",
+    ]
+
+
+# --- migrations ---
+# Applied in order, each in its own transaction; PRAGMA user_version records the
+# last one applied so an existing hospital_data.db upgrades in place. A step is
+# either a SQL statement or a callable taking the connection. Only ever append.
+MIGRATIONS = [
+    ("hot path indexes", [
+        # free beds per department, in allocation order
+        "CREATE INDEX IF NOT EXISTS idx_beds_free ON beddetails(department, bed_serial) WHERE occupied = 'NO'",
+        # covering index for occupancy counts
+        "CREATE INDEX IF NOT EXISTS idx_beds_department ON beddetails(department, occupied)",
+        # bed lookup on discharge
+        "CREATE INDEX IF NOT EXISTS idx_beds_patient ON beddetails(patient_sno) WHERE patient_sno IS NOT NULL",
+        # daily admission / discharge KPIs
+        "CREATE INDEX IF NOT EXISTS idx_patients_doa ON patients(doa)",
+        "CREATE INDEX IF NOT EXISTS idx_patients_dod ON patients(dod)",
+    ]),
+    ("mrd sequence", [
+        "CREATE TABLE IF NOT EXISTS sequences (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        # continue after the highest MRD-nnnn already issued, not the row count
+        """INSERT OR IGNORE INTO sequences (name, value)
+           SELECT 'mrd', COALESCE(MAX(CAST(substr(mrd_no, 5) AS INTEGER)), 0)
+           FROM patients WHERE mrd_no LIKE 'MRD-%'""",
+    ]),
+    ("department occupancy summary", [
+        """CREATE TABLE IF NOT EXISTS department_occupancy (
+               department TEXT PRIMARY KEY,
+               total INTEGER NOT NULL DEFAULT 0,
+               occupied INTEGER NOT NULL DEFAULT 0,
+               vacant INTEGER GENERATED ALWAYS AS (total - occupied) VIRTUAL
+           )""",
+        """CREATE TRIGGER IF NOT EXISTS trg_occupancy_insert AFTER INSERT ON beddetails BEGIN
+               INSERT OR IGNORE INTO department_occupancy (department) VALUES (NEW.department);
+               UPDATE department_occupancy SET total = total + 1, occupied = occupied + (NEW.occupied = 'YES')
+               WHERE department = NEW.department;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_occupancy_delete AFTER DELETE ON beddetails BEGIN
+               UPDATE department_occupancy SET total = total - 1, occupied = occupied - (OLD.occupied = 'YES')
+               WHERE department = OLD.department;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_occupancy_update AFTER UPDATE OF department, occupied ON beddetails
+           WHEN OLD.department IS NOT NEW.department OR OLD.occupied IS NOT NEW.occupied BEGIN
+               UPDATE department_occupancy SET total = total - 1, occupied = occupied - (OLD.occupied = 'YES')
+               WHERE department = OLD.department;
+               INSERT OR IGNORE INTO department_occupancy (department) VALUES (NEW.department);
+               UPDATE department_occupancy SET total = total + 1, occupied = occupied + (NEW.occupied = 'YES')
+               WHERE department = NEW.department;
+           END""",
+        rebuild_department_occupancy,
+    ]),
+    ("daily census rollup", [
+        """CREATE TABLE IF NOT EXISTS daily_census (
+               day TEXT NOT NULL,
+               department TEXT NOT NULL DEFAULT '',
+               admissions INTEGER NOT NULL DEFAULT 0,
+               discharges INTEGER NOT NULL DEFAULT 0,
+               deaths INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (day, department)
+           ) WITHOUT ROWID""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_census_insert AFTER INSERT ON patients BEGIN
+               {_census_delta("NEW", 1)}
+           END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_census_delete AFTER DELETE ON patients BEGIN
+               {_census_delta("OLD", -1)}
+           END""",
+        f"""CREATE TRIGGER IF NOT EXISTS trg_census_update AFTER UPDATE OF doa, dod, outcome, department ON patients
+           WHEN OLD.doa IS NOT NEW.doa OR OLD.dod IS NOT NEW.dod
+             OR OLD.outcome IS NOT NEW.outcome OR OLD.department IS NOT NEW.department BEGIN
+               {_census_delta("OLD", -1)}
+               {_census_delta("NEW", 1)}
+           END""",
+        rebuild_daily_census,
+    ]),
+    ("epoch timestamps for doa / dod", [
+        "ALTER TABLE patients ADD COLUMN doa_ts INTEGER",
+        "ALTER TABLE patients ADD COLUMN dod_ts INTEGER",
+        backfill_timestamps,
+        "DROP INDEX IF EXISTS idx_patients_doa",
+        "DROP INDEX IF EXISTS idx_patients_dod",
+        "CREATE INDEX IF NOT EXISTS idx_patients_doa_ts ON patients(doa_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_patients_dod_ts ON patients(dod_ts)",
+    ]),
+    ("patient search index", [
+        # external-content FTS5 index over patients, rowid = sno
+        """CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+               mrd_no, name, department, outcome, content='patients', content_rowid='sno',
+               prefix='2 3 4'
+           )""",
+        """CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON patients BEGIN
+               INSERT INTO patients_fts (rowid, mrd_no, name, department, outcome)
+               VALUES (NEW.sno, NEW.mrd_no, NEW.name, NEW.department, NEW.outcome);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON patients BEGIN
+               INSERT INTO patients_fts (patients_fts, rowid, mrd_no, name, department, outcome)
+               VALUES ('delete', OLD.sno, OLD.mrd_no, OLD.name, OLD.department, OLD.outcome);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_fts_update AFTER UPDATE OF mrd_no, name, department, outcome ON patients BEGIN
+               INSERT INTO patients_fts (patients_fts, rowid, mrd_no, name, department, outcome)
+               VALUES ('delete', OLD.sno, OLD.mrd_no, OLD.name, OLD.department, OLD.outcome);
+               INSERT INTO patients_fts (rowid, mrd_no, name, department, outcome)
+               VALUES (NEW.sno, NEW.mrd_no, NEW.name, NEW.department, NEW.outcome);
+           END""",
+        "INSERT INTO patients_fts (patients_fts) VALUES ('rebuild')",
+    ]),
+    ("filter value indexes", [
+        # SELECT DISTINCT for the filter pickers, and equality filters on these columns
+        "CREATE INDEX IF NOT EXISTS idx_patients_department ON patients(department)",
+        "CREATE INDEX IF NOT EXISTS idx_patients_outcome ON patients(outcome)",
+        "CREATE INDEX IF NOT EXISTS idx_patients_gender ON patients(gender)",
+        "CREATE INDEX IF NOT EXISTS idx_patients_admission_type ON patients(type_of_admission)",
+    ]),
+    ("patients archive", [
+        create_archive,
+        "CREATE INDEX IF NOT EXISTS idx_archive_doa_ts ON patients_archive(doa_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_archive_dod_ts ON patients_archive(dod_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_archive_mrd ON patients_archive(mrd_no)",
+        # moving a row to the archive is not a discharge being undone
+        "DROP TRIGGER IF EXISTS trg_census_delete",
+        f"""CREATE TRIGGER trg_census_delete AFTER DELETE ON patients
+           WHEN NOT EXISTS (SELECT 1 FROM patients_archive WHERE sno = OLD.sno) BEGIN
+               {_census_delta("OLD", -1)}
+           END""",
+    ]),
+    ("analytics snapshot tracking", [
+        """CREATE TABLE IF NOT EXISTS snapshot_dirty (
+               tbl TEXT NOT NULL,
+               chunk INTEGER NOT NULL,
+               gen INTEGER NOT NULL DEFAULT 1,
+               PRIMARY KEY (tbl, chunk)
+           ) WITHOUT ROWID""",
+        *_snapshot_triggers(),
+        # identifies this database to its snapshot directory
+        "INSERT OR IGNORE INTO sequences (name, value) VALUES ('snapshot', abs(random()))",
+        SEED_SNAPSHOT_SQL,
+    ]),
+    ("covering stay indexes for the bed forecast", [
+        # the forecast bins length of stay by department over a range of dod_ts;
+        # these answer it from the index alone and serve every dod_ts lookup too
+        "CREATE INDEX IF NOT EXISTS idx_patients_dod_stay ON patients(dod_ts, doa_ts, department)",
+        "CREATE INDEX IF NOT EXISTS idx_archive_dod_stay ON patients_archive(dod_ts, doa_ts, department)",
+        "DROP INDEX IF EXISTS idx_patients_dod_ts",
+        "DROP INDEX IF EXISTS idx_archive_dod_ts",
+    ]),
+    ("change feed", [
+        """CREATE TABLE IF NOT EXISTS events (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               at INTEGER NOT NULL,
+               kind TEXT NOT NULL,
+               sno INTEGER,
+               bed_serial TEXT,
+               department TEXT, doa TEXT, dod TEXT, los REAL, occupied INTEGER,
+               old_department TEXT, old_doa TEXT, old_dod TEXT, old_los REAL, old_occupied INTEGER
+           )""",
+        *_event_triggers(),
+    ]),
+    ("length of stay counts both end days", [
+        recount_stays,
+    ]),
+]
+
+def migrate(conn):
+    applied = []
+    isolation = conn.isolation_level
+    conn.isolation_level = None  # we issue BEGIN / COMMIT ourselves
+    try:
+        for version, (name, steps) in enumerate(MIGRATIONS, start=1):
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # another process may have migrated while we waited for the lock
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                    conn.execute("ROLLBACK")
+                    continue
+                for step in steps:
+                    step(conn) if callable(step) else conn.execute(step)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(f"{version}: {name}")
+    finally:
+        conn.isolation_level = isolation
+    return applied
+
+
+# --- query plans for the hot paths ---
+HOT_QUERIES = {
+    "free bed in department": (
+        "SELECT bed_serial FROM beddetails WHERE department = ? AND occupied = 'NO' ORDER BY bed_serial LIMIT 1",
+        ("General",)),
+    "bed by patient": (
+        "SELECT bed_serial FROM beddetails WHERE patient_sno = ?", (1,)),
+    "department occupancy": (
+        "SELECT department, COUNT(*), SUM(occupied = 'YES') FROM beddetails GROUP BY department", ()),
+    "admissions in range": (
+        "SELECT COUNT(*) FROM patients WHERE doa_ts >= ? AND doa_ts < ?", (1735689600, 1735776000)),
+    "discharges in range": (
+        "SELECT COUNT(*) FROM patients WHERE dod_ts >= ? AND dod_ts < ?", (1735689600, 1735776000)),
+    "patient search": (
+        "SELECT rowid FROM patients_fts WHERE patients_fts MATCH ? ORDER BY rank LIMIT 25", ('"gen"*',)),
+    "filter values": (
+        "SELECT DISTINCT outcome FROM patients WHERE outcome IS NOT NULL ORDER BY outcome", ()),
+    "filtered page": (
+        "SELECT * FROM patients WHERE department IN (?) AND sno > ? ORDER BY sno LIMIT 50", ("General", 0)),
+    "census window": (
+        "SELECT day, SUM(admissions), SUM(discharges) FROM daily_census WHERE day >= ? GROUP BY day",
+        ("2025-01-01",)),
+    "change feed poll": (
+        "SELECT * FROM events WHERE id > ? ORDER BY id LIMIT ?", (0, 2000)),
+}
+
+
+def explain(conn):
+    for name, (sql, params) in HOT_QUERIES.items():
+        print(f"--- {name}")
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params):
+            print(f"    {row[-1]}")
+
+
+# --- CSV import ---
+def resolve_export_dates(df, stay):
+    # An export date such as 1/4/2017 reads both ways round. Each row takes the
+    # order (the same for its doa and dod) whose stay matches the exported
+    # DURATION OF STAY, which counts both end days; month first when that
+    # doesn't settle it. The chosen dates come back as ISO text.
+    def parse(fmt):
+        doa = pd.to_datetime(df["doa"], format=fmt, errors="coerce")
+        dod = pd.to_datetime(df["dod"], format=fmt, errors="coerce") if "dod" in df else pd.Series(pd.NaT, df.index)
+        valid = doa.notna() & (dod.notna() | df.get("dod", pd.Series(pd.NA, df.index)).isna())
+        miss = ((dod - doa).dt.days + 1 - stay).abs().fillna(0).where(valid, float("inf"))
+        return doa, dod, miss
+
+    doa, dod, miss = parse(CSV_DATE_FORMAT)
+    doa_d, dod_d, miss_d = parse(CSV_DAY_FIRST_FORMAT)
+    day_first = miss_d < miss
+    df = df.copy()
+    for col, month, day in (("doa", doa, doa_d), ("dod", dod, dod_d)):
+        if col in df:
+            chosen = month.where(~day_first, day)
+            # anything that parses neither way goes on to normalize_dates as it was
+            df[col] = chosen.dt.strftime("%Y-%m-%d").where(chosen.notna(), df[col])
+    return df
+
+
+def _prepare_chunk(chunk):
+    chunk.columns = chunk.columns.str.strip()  # "SMOKING " in the export
+    df = chunk[[c for c in CSV_COLUMNS if c in chunk.columns]].rename(columns=CSV_COLUMNS)
+
+    exported_stay = pd.to_numeric(df.get("duration_of_stay"), errors="coerce")
+    if "doa" in df:
+        df = resolve_export_dates(df, exported_stay)
+    df = normalize_dates(df)
+    if exported_stay is not None:
+        # the export's own figure is the stored stay; dod - doa only fills gaps
+        df["duration_of_stay"] = exported_stay.astype("Float64").fillna(df["duration_of_stay"].astype("Float64"))
+
+    df["mrd_no"] = df["mrd_no"].astype(str).str.strip()
+    df["department"] = DEFAULT_DEPARTMENT
+    if "gender" in df:
+        df["gender"] = df["gender"].str.strip().map(GENDERS).fillna(df["gender"])
+    if "type_of_admission" in df:
+        df["type_of_admission"] = df["type_of_admission"].str.strip().map(ADMISSION_TYPES)
+    else:
+        df["type_of_admission"] = None
+    df["type_of_admission"] = df["type_of_admission"].fillna("Routine")
+    if "outcome" in df:
+        df["outcome"] = df["outcome"].str.strip().str.upper().map(OUTCOMES).fillna(df["outcome"])
+    for c in FLAG_COLUMNS:
+        if c in df:
+            df[c] = pd.to_numeric(df[c], errors="coerce").map({1: "Yes", 0: "No"})
+    for c in LAB_COLUMNS:
+        if c in df:
+            df[c] = pd.to_numeric(df[c], errors="coerce")  # "EMPTY" etc. -> NULL
+
+    return sql_values(df)
+
+
+def assign_beds(cur, since_sno):
+    # one pass over the free beds, then hand them out in memory
+    pool = defaultdict(deque)
+    for serial, dept in cur.execute(
+        "SELECT bed_serial, department FROM beddetails WHERE occupied = 'NO' ORDER BY bed_serial"
+    ):
+        pool[dept].append(serial)
+
+    updates = []
+    for sno, dept in cur.execute("""
+        SELECT sno, department FROM patients
+        WHERE sno > ? AND dod IS NULL
+          AND sno NOT IN (SELECT patient_sno FROM beddetails WHERE patient_sno IS NOT NULL)
+        ORDER BY sno
+    """, (since_sno,)).fetchall():
+        if pool[dept]:
+            updates.append((sno, pool[dept].popleft()))
+
+    cur.executemany("UPDATE beddetails SET occupied = 'YES', patient_sno = ? WHERE bed_serial = ?", updates)
+    return len(updates)
+
+
+# per-row upkeep the import skips: each of these is redone once, in bulk, at the end
+BULK_IMPORT_TRIGGERS = ["trg_census_insert", "trg_fts_insert", "trg_snapshot_patients_insert", "trg_events_admit"]
+
+
+def import_admissions(conn, path=CSV_FILE, chunk_size=CHUNK_SIZE):
+    cur = conn.cursor()
+    if not conn.in_transaction:
+        cur.execute("BEGIN IMMEDIATE")  # DDL alone doesn't open one, and the triggers must come back
+    since_sno = cur.execute("SELECT COALESCE(MAX(sno), 0) FROM patients").fetchone()[0]
+    start = time.perf_counter()
+    read = inserted = 0
+    triggers = cur.execute(f"""
+        SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({', '.join('?' * len(BULK_IMPORT_TRIGGERS))})
+    """, BULK_IMPORT_TRIGGERS).fetchall()
+    for name, _ in triggers:
+        cur.execute(f"DROP TRIGGER {name}")
+
+    for chunk in pd.read_csv(path, chunksize=chunk_size, dtype=str, skipinitialspace=True):
+        df = _prepare_chunk(chunk)
+        mrd = df.columns.get_loc("mrd_no")
+        columns = ", ".join(df.columns)
+        placeholders = ", ".join("?" * len(df.columns))
+        # UNIQUE(mrd_no) covers live patients only: an archived encounter must not come back as a new one
+        cur.executemany(f"""
+            INSERT OR IGNORE INTO patients ({columns}) SELECT {placeholders}
+            WHERE NOT EXISTS (SELECT 1 FROM patients_archive WHERE mrd_no = ?)
+        """, ((*row, row[mrd]) for row in df.itertuples(index=False, name=None)))
+        inserted += cur.rowcount  # total_changes would also count trigger writes
+        read += len(df)
+
+    for _, sql in triggers:
+        cur.execute(sql)
+    if inserted:
+        if not since_sno:
+            # into an empty table: one pass over everything is the cheapest way
+            rebuild_daily_census(conn)
+            cur.execute("INSERT INTO patients_fts (patients_fts) VALUES ('rebuild')")
+        else:
+            # the new rows only, so a small import into a large database stays small
+            add_to_daily_census(conn, since_sno)
             cur.execute("""
-                SELECT bed_serial FROM beddetails
-                WHERE department = ? AND occupied = 'NO'
-                ORDER BY bed_serial ASC LIMIT 1
-            """, (row.get("department"),))
-            bed = cur.fetchone()
-            if bed:
-                cur.execute("""
-                    UPDATE beddetails SET occupied = 'YES', patient_sno = ?
-                    WHERE bed_serial = ?
-                """, (patient_sno, bed[0]))
-
-conn.commit()
-conn.close()
-print("✅ Database created with updated patients table (type_of_admission included), 50 beds per department, CSV imported, auto bed assignment, and duration of stay calculated")
\ No newline at end of file
+                INSERT INTO patients_fts (rowid, mrd_no, name, department, outcome)
+                SELECT sno, mrd_no, name, department, outcome FROM patients WHERE sno > ?
+            """, (since_sno,))
+        cur.execute(f"""
+            INSERT INTO snapshot_dirty (tbl, chunk)
+            SELECT 'patients', sno / {SNAPSHOT_CHUNK} FROM patients WHERE sno > ? GROUP BY 2
+            ON CONFLICT (tbl, chunk) DO UPDATE SET gen = gen + 1
+        """, (since_sno,))
+        # one event in place of an admit per row: live readers reload their totals
+        cur.execute(f"INSERT INTO events (at, kind) VALUES ({NOW_SQL}, 'reload')")
+    beds = assign_beds(cur, since_sno)
+    elapsed = time.perf_counter() - start
+    return {"read": read, "inserted": inserted, "beds": beds, "seconds": elapsed,
+            "rows_per_sec": read / elapsed if elapsed else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the SmartCare database and import admissions.")
+    parser.add_argument("--csv", default=CSV_FILE, help="admission export to import")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--explain", action="store_true", help="print query plans for the hot queries and exit")
+    parser.add_argument("--check-occupancy", action="store_true",
+                        help="recount department_occupancy from beddetails, repair any drift and exit")
+    parser.add_argument("--archive", type=int, nargs="?", const=ARCHIVE_AFTER_DAYS, metavar="DAYS",
+                        help=f"move encounters closed more than DAYS (default {ARCHIVE_AFTER_DAYS}) days ago "
+                             "into patients_archive and exit")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(DB_FILE)
+    cur = conn.cursor()
+    create_schema(cur)
+    conn.commit()
+    for name in migrate(conn):
+        print(f"✅ Applied migration {name}")
+    if args.explain:
+        explain(conn)
+        conn.close()
+        return
+    if args.check_occupancy:
+        drift = check_department_occupancy(conn)
+        conn.commit()
+        conn.close()
+        for row in drift:
+            print(f"⚠️ {row['department']}: expected (total, occupied) {row['expected']}, found {row['actual']}")
+        print(f"✅ department_occupancy {'rebuilt' if drift else 'consistent'}")
+        return
+    if args.archive is not None:
+        moved = archive_closed(conn, args.archive)
+        conn.close()
+        print(f"✅ Archived {moved} encounters closed more than {args.archive} days ago")
+        return
+
+    create_beds(cur)
+
+    # --- Import data from the admission export if available and assign beds ---
+    # everything below runs in one transaction; sqlite3 opens it on the first INSERT
+    stats = None
+    if os.path.exists(args.csv):
+        stats = import_admissions(conn, args.csv, args.chunk_size)
+
+    conn.commit()
+    conn.close()
+    print(f"✅ Database created with {bed_count} beds per department")
+    if stats:
+        print(f"✅ Imported {stats['inserted']} of {stats['read']} rows from {args.csv} "
+              f"in {stats['seconds']:.2f}s ({stats['rows_per_sec']:,.0f} rows/s), {stats['beds']} beds assigned")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# forecast.py
+# Bed demand per department over the next few days. Beds in use h days from
+# now are the current inpatients still in hospital plus the admissions still to
+# come, each weighted by the chance a stay lasts that long:
+#   occupied(h) = sum_a n[a] * S(a + h) / S(a)  +  sum_{j<=h} arrivals[j] * S(h - j)
+# S(k) is the share of stays longer than k and a half days (admissions and the
+# forecast clock are taken to fall mid-day), n[a] the inpatients admitted
+# a days ago and arrivals[j] the expected admissions on day j (mean per weekday
+# over the last ARRIVAL_WEEKS weeks of daily_census). Both sums are gathers over
+# one (department, day) grid, so every department is forecast in one pass.
+# The length-of-stay histograms cover the last LOS_HISTORY_DAYS of discharges
+# and live in LosModel between forecasts. A refit only adds the discharges that
+# have settled (older than SETTLE_DAYS) since the last one and takes out those
+# that aged out of the window; the last SETTLE_DAYS are re-read every time, so
+# late-entered discharges still count.
+#   python forecast.py --days 14
+import sqlite3
+import argparse
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from create_database import DB_FILE, DAY_SECONDS, wall_clock_now
+
+HORIZON_DAYS = 14
+MAX_LOS_DAYS = 120   # longer stays are counted as this long
+ARRIVAL_WEEKS = 8
+LOS_HISTORY_DAYS = 365
+SETTLE_DAYS = 30     # discharges this recent are re-read on every refit
+MIN_STAYS = 30       # below this a department uses the hospital-wide LOS curve
+BAND_Z = 1.2816      # low / high are the 10th and 90th percentiles
+PRESSURE_COLUMNS = ["department", "beds", "in_use", "expected_end", "peak_high", "full_from", "at_risk_from"]
+
+
+def _sources(conn):
+    tables = ["patients"]
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'patients_archive'").fetchone():
+        tables.append("patients_archive")
+    return tables
+
+
+def los_counts(conn, start=None, end=None):
+    # closed stays discharged in [start, end) as (department, LOS days, count), binned in SQL.
+    # Beds are held for the elapsed time, so this is dod_ts - doa_ts in whole days, not
+    # duration_of_stay, which counts the admission and the discharge day both
+    where = ["dod_ts IS NOT NULL", "doa_ts IS NOT NULL"]
+    if start is not None:
+        where.append("dod_ts >= :start")
+    if end is not None:
+        where.append("dod_ts < :end")
+    stays = " UNION ALL ".join(f"SELECT department, doa_ts, dod_ts FROM {table} WHERE {' AND '.join(where)}"
+                               for table in _sources(conn))
+    return conn.execute(f"""
+        SELECT IFNULL(department, ''), MAX(0, MIN((dod_ts - doa_ts) / {DAY_SECONDS}, {MAX_LOS_DAYS})), COUNT(*)
+        FROM ({stays}) GROUP BY 1, 2
+    """, {"start": start, "end": end}).fetchall()
+
+
+def _add(histograms, rows, sign=1):
+    for department, days, count in rows:
+        histograms.setdefault(department, np.zeros(MAX_LOS_DAYS + 1, np.int64))[days] += sign * count
+
+
+class LosModel:
+    # length-of-stay histograms per department over a sliding window of discharges
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.settled = {}
+        self.window = None  # (start, end) epoch seconds of the discharges in `settled`
+        self.refits = 0
+
+    def refit(self, conn, now=None):
+        # returns the current histograms, reading only what changed since the last refit
+        end = (int(now or wall_clock_now()) // DAY_SECONDS - SETTLE_DAYS) * DAY_SECONDS
+        start = end - (LOS_HISTORY_DAYS - SETTLE_DAYS) * DAY_SECONDS
+        with self.lock:
+            if self.window is None:
+                _add(self.settled, los_counts(conn, start, end))
+            elif end > self.window[1]:
+                _add(self.settled, los_counts(conn, self.window[1], end))
+                _add(self.settled, los_counts(conn, self.window[0], start), sign=-1)
+            self.window = max(self.window or (start, end), (start, end))
+            # a discharge deleted after it was counted could leave a count below zero
+            histograms = {d: h.clip(0) for d, h in self.settled.items()}
+            self.refits += 1
+        _add(histograms, los_counts(conn, self.window[1]))
+        return histograms
+
+    def reset(self):
+        with self.lock:
+            self.settled, self.window = {}, None
+
+    def stays(self):
+        with self.lock:
+            return int(sum(h.sum() for h in self.settled.values()))
+
+
+def survival(histograms, departments):
+    # S[d, k] = share of department d's stays that last past k + 1/2 days, k = 0..MAX_LOS_DAYS:
+    # a stay binned at k days ran k to k + 1 days, so it counts half at its own k
+    pooled = sum(histograms.values(), np.zeros(MAX_LOS_DAYS + 1, np.int64))
+    counts = np.array([histograms[d] if d in histograms and histograms[d].sum() >= MIN_STAYS else pooled
+                       for d in departments], np.float64).reshape(len(departments), MAX_LOS_DAYS + 1)
+    totals = counts.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore"):
+        return np.where(totals > 0, 1 - (counts.cumsum(axis=1) - counts / 2) / totals, 0.0).clip(0)
+
+
+def inpatients(conn, departments, now):
+    # n[d, a]: current inpatients of department d admitted a days ago
+    index = {d: i for i, d in enumerate(departments)}
+    n = np.zeros((len(departments), MAX_LOS_DAYS + 1))
+    rows = conn.execute(f"""
+        SELECT IFNULL(department, ''), MAX(0, MIN((:now - doa_ts) / {DAY_SECONDS}, {MAX_LOS_DAYS})), COUNT(*)
+        FROM patients WHERE dod_ts IS NULL AND doa_ts IS NOT NULL GROUP BY 1, 2
+    """, {"now": now}).fetchall()
+    for department, days, count in rows:
+        if department in index:
+            n[index[department], days] += count
+    return n
+
+
+def arrival_rates(conn, departments, now, weeks=ARRIVAL_WEEKS):
+    # mean admissions per (department, weekday) over the last `weeks` full weeks
+    today = pd.Timestamp(now, unit="s").normalize()
+    days = pd.date_range(today - pd.Timedelta(weeks=weeks), periods=weeks * 7)
+    census = pd.read_sql_query("SELECT day, department, admissions FROM daily_census WHERE day >= ? AND day < ?",
+                               conn, params=(days[0].strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d")))
+    weekday = pd.to_datetime(census["day"]).dt.dayofweek
+    rates = (census.assign(weekday=weekday).groupby(["department", "weekday"])["admissions"].sum() / weeks)
+    return rates.unstack(fill_value=0).reindex(index=departments, columns=range(7), fill_value=0).to_numpy(np.float64)
+
+
+def forecast(conn, model, departments, days=HORIZON_DAYS, now=None):
+    # expected beds in use per department at now + h days, h = 0..days, with a 10-90% band
+    now = int(now or wall_clock_now())
+    S = survival(model.refit(conn, now), departments)
+    n = inpatients(conn, departments, now)
+    h = np.arange(days + 1)
+
+    # inpatients: survival from a to a + h days in, given they have lasted a
+    a = np.arange(MAX_LOS_DAYS + 1)
+    later = S[:, np.minimum(a[:, None] + h, MAX_LOS_DAYS)]
+    now_s = S[:, a][:, :, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stay = np.where(now_s > 0, later / now_s, 1.0)  # outlasted every recorded stay: assume they stay
+    mean = np.einsum("da,dah->dh", n, stay)
+    var = np.einsum("da,dah->dh", n, stay * (1 - stay))
+
+    # arrivals on day j (1..h) are h - j days (+ about half a day) in by day h
+    j = np.arange(1, days + 1)
+    weekdays = pd.to_datetime(now + (j - 0.5) * DAY_SECONDS, unit="s").dayofweek.to_numpy()
+    arrivals = arrival_rates(conn, departments, now)[:, weekdays]
+    lag = h[:, None] - j[None, :]
+    kernel = np.where(lag >= 0, S[:, lag.clip(0, MAX_LOS_DAYS)], 0.0)
+    expected = np.einsum("dhj,dj->dh", kernel, arrivals)
+    mean, var = mean + expected, var + expected  # thinned Poisson arrivals: variance = mean
+
+    sd = np.sqrt(var)
+    dates = pd.to_datetime(now + h * DAY_SECONDS, unit="s")
+    return pd.DataFrame({
+        "department": np.repeat(np.array(departments, dtype=object), len(h)),
+        "date": np.tile(dates, len(departments)),
+        "days_ahead": np.tile(h, len(departments)),
+        "expected": mean.ravel().round(1),
+        "low": (mean - BAND_Z * sd).clip(0).ravel().round(1),
+        "high": (mean + BAND_Z * sd).ravel().round(1),
+    })
+
+
+def pressure(fc, beds):
+    # per department: beds, in use now, expected at the horizon and the first day each bound reaches capacity
+    fc = fc.merge(beds, on="department")
+    def first_day(rows, col):
+        full = rows.loc[rows[col] >= rows["total"], "date"]
+        return full.iloc[0].date() if len(full) else None
+    return pd.DataFrame([{
+        "department": department,
+        "beds": int(rows["total"].iloc[0]),
+        "in_use": rows["expected"].iloc[0],
+        "expected_end": rows["expected"].iloc[-1],
+        "peak_high": rows["high"].max(),
+        "full_from": first_day(rows, "expected"),
+        "at_risk_from": first_day(rows, "high"),
+    } for department, rows in fc.groupby("department", sort=False)], columns=PRESSURE_COLUMNS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forecast beds in use per department.")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--days", type=int, default=HORIZON_DAYS)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    conn = sqlite3.connect(args.db)
+    beds = pd.read_sql_query("SELECT department, total FROM department_occupancy WHERE total > 0 ORDER BY department", conn)
+    fc = forecast(conn, LosModel(), beds["department"].tolist(), args.days)
+    conn.close()
+    print(pressure(fc, beds).to_string(index=False))
+    print(f"✅ Forecast {args.days} day(s) for {len(beds)} department(s) in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
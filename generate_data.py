@@ -0,0 +1,174 @@
+# generate_data.py
+# Deterministic synthetic hospital data for load testing the dashboard:
+#   python generate_data.py --patients 1000000 --years 5 --fresh
+import sqlite3
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from create_database import (DB_FILE, DAY_SECONDS, create_schema, migrate, normalize_dates,
+                             sql_values, assign_beds, bed_prefix)
+
+# department -> (share of admissions, median length of stay in days)
+DEPARTMENT_PROFILES = {
+    "General": (0.30, 3.0),
+    "ICU": (0.08, 6.0),
+    "Pediatrics": (0.14, 2.5),
+    "Maternity": (0.12, 2.0),
+    "Surgery": (0.16, 4.5),
+    "Cardiology": (0.06, 5.0),
+    "Neurology": (0.04, 5.5),
+    "Oncology": (0.04, 7.0),
+    "Orthopedics": (0.04, 4.0),
+    "Nephrology": (0.02, 4.5),
+}
+FIRST_NAMES = ["Aarav", "Aisha", "Ben", "Chen", "Diya", "Elena", "Farah", "Gabriel", "Hana", "Ibrahim",
+               "Jia", "Kavya", "Liam", "Maria", "Noah", "Omar", "Priya", "Rohan", "Sara", "Yusuf"]
+LAST_NAMES = ["Ahmed", "Brown", "Das", "Fernandez", "Garcia", "Iyer", "Khan", "Kim", "Lopez", "Mehta",
+              "Nair", "Okafor", "Patel", "Reddy", "Rossi", "Sharma", "Singh", "Smith", "Wang", "Zhang"]
+BED_HEADROOM = 1.15  # beds per department relative to its current inpatient count
+BATCH_SIZE = 50_000
+
+
+def yes_no(mask):
+    return np.where(mask, "Yes", "No")
+
+
+def generate_patients(n, departments, years, rng, now, first_sno=1):
+    # department mix and length of stay
+    shares = np.array([DEPARTMENT_PROFILES[d][0] for d in departments])
+    dept_idx = rng.choice(len(departments), size=n, p=shares / shares.sum())
+    dept = np.array(departments)[dept_idx]
+    median_los = np.array([DEPARTMENT_PROFILES[d][1] for d in departments])[dept_idx]
+
+    # admissions spread over the window, a little busier on weekdays, in sno order
+    span = int(years * 365 * DAY_SECONDS)
+    doa = now - rng.integers(0, span, size=n)
+    weekend = pd.to_datetime(doa, unit="s").dayofweek.to_numpy() >= 5
+    doa = np.sort(np.where(weekend & (rng.random(n) < 0.25), doa - 2 * DAY_SECONDS, doa))
+
+    # age and gender depend on the ward
+    age = np.clip(rng.normal(55, 18, n), 18, 95)
+    age = np.where(dept == "Pediatrics", rng.integers(0, 18, n), age)
+    age = np.where(dept == "Maternity", rng.integers(18, 45, n), age).astype(int)
+    gender = np.where(rng.random(n) < 0.5, "Male", "Female")
+    gender = np.where(dept == "Maternity", "Female", gender)
+
+    # comorbidities, more likely with age
+    older = (age - 18).clip(0) / 77
+    smoking = rng.random(n) < np.where(gender == "Male", 0.28, 0.10)
+    alcohol = rng.random(n) < np.where(gender == "Male", 0.22, 0.06)
+    anaemia = rng.random(n) < 0.15 + 0.20 * older
+    heart_failure = rng.random(n) < 0.02 + 0.25 * older
+    uti = rng.random(n) < 0.08 + 0.10 * older
+    chest_infection = rng.random(n) < 0.06 + 0.10 * older + 0.08 * smoking
+
+    # log-normal stays, longer with heart failure / chest infection
+    los = rng.lognormal(np.log(median_los), 0.6) * (1 + 0.4 * heart_failure + 0.25 * chest_infection)
+    dod = doa + (los * DAY_SECONDS).astype(np.int64)
+
+    # outcomes; stays that run past `now` are current inpatients
+    p_death = 0.01 + 0.06 * older + 0.08 * heart_failure + 0.10 * (dept == "ICU")
+    roll = rng.random(n)
+    outcome = np.where(roll < p_death, "Deceased", np.where(roll < p_death + 0.04, "DAMA", "Discharged"))
+    open_stay = dod > now
+    outcome = np.where(open_stay, "Admitted", outcome)
+
+    labs = {
+        "hb": np.round(rng.normal(13.5, 1.6, n) - 2.5 * anaemia, 1),
+        "tlc": np.round(rng.lognormal(np.log(8.5), 0.35, n) * (1 + 0.5 * chest_infection), 1),
+        "platelets": np.round(rng.normal(260, 70, n).clip(20), 0),
+        "glucose": np.round(rng.lognormal(np.log(125), 0.3, n), 0),
+    }
+    names = (np.array(FIRST_NAMES)[rng.integers(0, len(FIRST_NAMES), n)] + " "
+             + np.array(LAST_NAMES)[rng.integers(0, len(LAST_NAMES), n)])
+
+    df = pd.DataFrame({
+        "mrd_no": [f"MRD-{i:07d}" for i in range(first_sno, first_sno + n)],
+        "doa": pd.to_datetime(doa, unit="s"),
+        "dod": pd.to_datetime(np.where(open_stay, np.nan, dod), unit="s"),
+        "name": names,
+        "age": age,
+        "gender": gender,
+        "department": dept,
+        "type_of_admission": np.where(rng.random(n) < 0.45, "Emergency", "Routine"),
+        "outcome": outcome,
+        "smoking": yes_no(smoking),
+        "alcohol": yes_no(alcohol),
+        **labs,
+        "anaemia": yes_no(anaemia),
+        "heart_failure": yes_no(heart_failure),
+        "uti": yes_no(uti),
+        "chest_infection": yes_no(chest_infection),
+    })
+    return normalize_dates(df)
+
+
+def provision_beds(cur, census, beds_per_department=None):
+    rows = []
+    for dept, inpatients in census.items():
+        count = beds_per_department or max(10, math.ceil(inpatients * BED_HEADROOM))
+        rows += [(f"{bed_prefix(dept)}-{i:03d}", dept) for i in range(1, count + 1)]
+    cur.executemany("INSERT OR IGNORE INTO beddetails (bed_serial, department) VALUES (?,?)", rows)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a SmartCare database with synthetic patients.")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--patients", type=int, default=100_000)
+    parser.add_argument("--departments", type=int, default=5, help=f"1-{len(DEPARTMENT_PROFILES)}")
+    parser.add_argument("--beds-per-department", type=int, default=None,
+                        help="default: sized to each department's current inpatients")
+    parser.add_argument("--years", type=float, default=3.0, help="history covered by the admissions")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--as-of", default=None, help="date the history ends on (default: today)")
+    parser.add_argument("--fresh", action="store_true", help="delete the database first")
+    args = parser.parse_args()
+
+    if args.fresh:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    start = time.perf_counter()
+    rng = np.random.default_rng(args.seed)
+    departments = list(DEPARTMENT_PROFILES)[:max(1, min(args.departments, len(DEPARTMENT_PROFILES)))]
+    # the same --seed and --as-of always produce the same database
+    now = int(pd.Timestamp(args.as_of or "today").normalize().timestamp())
+
+    conn = sqlite3.connect(args.db)
+    cur = conn.cursor()
+    create_schema(cur)
+    conn.commit()
+    migrate(conn)
+
+    first_sno = cur.execute("SELECT COALESCE(MAX(sno), 0) FROM patients").fetchone()[0] + 1
+    df = generate_patients(args.patients, departments, args.years, rng, now, first_sno)
+    census = df.loc[df["dod"].isna(), "department"].value_counts().reindex(departments, fill_value=0)
+    beds = provision_beds(cur, census, args.beds_per_department)
+
+    columns = ", ".join(df.columns)
+    placeholders = ", ".join("?" * len(df.columns))
+    for lo in range(0, len(df), BATCH_SIZE):
+        batch = sql_values(df.iloc[lo:lo + BATCH_SIZE])
+        cur.executemany(f"INSERT OR IGNORE INTO patients ({columns}) VALUES ({placeholders})",
+                        batch.itertuples(index=False, name=None))
+        print(f"  {min(lo + BATCH_SIZE, len(df)):,} / {len(df):,} patients", end="\r")
+    print()
+    assigned = assign_beds(cur, first_sno - 1)
+    # Staff Tools MRDs continue after the generated ones
+    cur.execute("UPDATE sequences SET value = MAX(value, ?) WHERE name = 'mrd'", (first_sno + len(df) - 1,))
+    conn.commit()
+    conn.close()
+
+    print(f"✅ Generated {len(df):,} patients across {len(departments)} departments and {beds:,} beds "
+          f"({assigned:,} occupied) in {time.perf_counter() - start:.1f}s → {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,636 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
+import pyarrow as pa
+import threading
+import os
+import re
+import time
+import queue
+import logging
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from create_database import (migrate, check_department_occupancy, normalize_record, normalize_dates, sql_values,
+                             EPOCH, DAY_SECONDS, wall_clock_now,
+                             reserve_bed_serials, archive_closed, ARCHIVE_AFTER_DAYS, FLAG_COLUMNS, LAB_COLUMNS)
+from snapshot import (TABLE_SCHEMAS, apply_schema, to_arrow, histogram, top_values, snapshot_dir,
+                      is_fresh, clear_marks, read as read_snapshot, refresh as refresh_snapshot)
+from forecast import HORIZON_DAYS, ARRIVAL_WEEKS, LOS_HISTORY_DAYS, LosModel, forecast as forecast_beds, pressure
 
-DB_FILE = "hospital_data.db"
+DB_FILE = os.environ.get("SMARTCARE_DB", "hospital_data.db")
+SNAPSHOT_DIR = snapshot_dir(DB_FILE)
+SNAPSHOT_DELAY = 2  # seconds a refresh waits for more writes to land first
+SNAPSHOT_WORKER = os.environ.get("SMARTCARE_SNAPSHOT_WORKER", "1") != "0"  # 0: no background refresh
 ADMIN_PASSWORD = "admin123"
 LOGO = "logo.jpeg"
+SEARCH_PAGE_SIZE = 25
+SEARCH_RANK_LIMIT = 1000  # broader matches are listed newest first instead of ranked
+FILTER_PAGE_SIZE = 50
+DISTINCT_LIMIT = 500      # values offered per filter picker
+LIVE_POLL_SECONDS = 5     # how often the Dashboard KPIs check the change feed
+LIVE_MAX_EVENTS = 2000    # a session further behind than this reloads its KPIs
+
+# --- connection pool settings ---
+POOL_SIZE = 4                  # long-lived connections shared by all sessions
+POOL_TIMEOUT = 30              # seconds to wait for a connection when all are checked out
+BUSY_TIMEOUT = 10              # seconds to wait on a locked database
+MMAP_SIZE = 256 * 1024 * 1024  # memory-mapped I/O window
+CACHE_KB = 32 * 1024           # page cache per connection
+
+# --- instrumentation settings ---
+INSTRUMENT = os.environ.get("SMARTCARE_INSTRUMENT", "1") != "0"
+SLOW_MS = float(os.environ.get("SMARTCARE_SLOW_MS", "250"))  # operations above this go to the slow log
+SLOW_LOG = "slow_ops.log"
+METRIC_WINDOW = 500  # samples kept per operation for the rolling percentiles
+SQL_TEXT_LIMIT = 200
 
 
 st.set_page_config(page_title="SmartCare Dashboard", page_icon=LOGO, layout="wide")
 
+def parse_lab(text):
+    # lab fields are free text in the forms; store a number or NULL, never a string
+    text = str(text).strip()
+    return float(text) if text else None
+
+# --- instrumentation ---
+# Every SQL statement run on a pooled connection and every timed() block is
+# recorded per operation: a bounded deque of durations for the rolling
+# percentiles, plus a slow log for anything over SLOW_MS. Recording is an
+# append under a lock; percentiles are only computed when the panel asks.
+_SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    # literals become ?, IN lists collapse, so one query shape is one operation
+    sql = _SQL_LITERAL.sub("?", " ".join(sql.split()))
+    return _SQL_IN_LIST.sub("(?, ...)", sql)[:SQL_TEXT_LIMIT]
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}  # (kind, name) -> deque of ms
+        self.counts = {}   # (kind, name) -> [calls, rows]
+        self.slow = deque(maxlen=100)
+        self.log = logging.getLogger("smartcare.slow")
+        self.log.propagate = False
+        if not self.log.handlers:
+            handler = logging.FileHandler(SLOW_LOG)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.log.addHandler(handler)
+            self.log.setLevel(logging.INFO)
+
+    def record(self, kind, name, ms, rows=None):
+        key = (kind, name)
+        with self.lock:
+            if key not in self.samples:
+                self.samples[key] = deque(maxlen=METRIC_WINDOW)
+                self.counts[key] = [0, 0]
+            self.samples[key].append(ms)
+            self.counts[key][0] += 1
+            self.counts[key][1] += rows or 0
+        if ms >= SLOW_MS:
+            line = f"{kind:6s} {ms:9.1f} ms" + (f" rows={rows}" if rows is not None else "") + f"  {name}"
+            self.slow.append((time.strftime("%Y-%m-%d %H:%M:%S"), kind, round(ms, 1), rows, name))
+            self.log.info(line)
+
+    def summary(self):
+        with self.lock:
+            items = [(key, np.array(samples), self.counts[key]) for key, samples in self.samples.items()]
+        rows = []
+        for (kind, name), ms, (calls, total_rows) in items:
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            rows.append({"kind": kind, "operation": name, "calls": calls, "p50_ms": p50, "p95_ms": p95,
+                         "p99_ms": p99, "max_ms": ms.max(), "rows/call": total_rows / calls if kind == "sql" else None})
+        df = pd.DataFrame(rows, columns=["kind", "operation", "calls", "p50_ms", "p95_ms", "p99_ms", "max_ms", "rows/call"])
+        return df.sort_values("p95_ms", ascending=False).round(2)
+
+    def slow_ops(self):
+        with self.lock:
+            return pd.DataFrame(list(self.slow)[::-1], columns=["when", "kind", "ms", "rows", "operation"])
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.counts.clear()
+            self.slow.clear()
+
+@st.cache_resource
+def get_metrics():
+    return Metrics()
+
+@contextmanager
+def timed(kind, name):
+    if not INSTRUMENT:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_metrics().record(kind, name, (time.perf_counter() - start) * 1000)
+
+class TimedCursor(sqlite3.Cursor):
+    # a statement's time is its execute plus the fetches that drain it; it is
+    # recorded once the result is consumed (fetchall, fetchone, exhausted
+    # iteration), the next statement starts, or the cursor is closed;
+    # statements that return no rows are recorded straight away
+    pending = None
+
+    def _flush(self):
+        if self.pending:
+            get_metrics().record("sql", *self.pending)
+            self.pending = None
+
+    def _run(self, method, sql, args):
+        self._flush()
+        start = time.perf_counter()
+        try:
+            return method(sql, args)
+        finally:
+            self.pending = [normalize_sql(sql), (time.perf_counter() - start) * 1000, max(self.rowcount, 0)]
+            if self.description is None:  # nothing to fetch
+                self._flush()
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters)
+
+    def _fetched(self, start, rows, done):
+        if self.pending:
+            self.pending[1] += (time.perf_counter() - start) * 1000
+            self.pending[2] += rows
+            if done:
+                self._flush()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None, True)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        size = self.arraysize if size is None else size
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0, True)
+            raise
+        self._fetched(start, 1, False)
+        return row
+
+    def close(self):
+        self._flush()
+        super().close()
+
+class TimedConnection(sqlite3.Connection):
+    # Connection.execute would bypass the cursor subclass, so route it through one
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
 # --- utility functions ---
-def get_conn():
-    return sqlite3.connect(DB_FILE, check_same_thread=False)
-
-def read_table(name):
-    conn = get_conn()
-    df = pd.read_sql_query(f"SELECT * FROM {name}", conn)
-    conn.close()
-    return df
-
-def exec_sql(sql, params=()):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(sql, params)
-    conn.commit()
-    conn.close()
-def generate_mrd():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM patients")
-    count = cur.fetchone()[0] + 1
-    conn.close()
-    return f"MRD-{count:04d}"
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.opened = 0
+        self.lock = threading.Lock()
+        self.idle = queue.LifoQueue()
+
+    def _open(self):
+        # autocommit mode: transactions are opened explicitly by transaction()
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None,
+                               factory=TimedConnection if INSTRUMENT else sqlite3.Connection)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                grow = self.opened < self.size
+                if grow:
+                    self.opened += 1
+            # every connection is checked out: wait for one to come back
+            try:
+                conn = self._open() if grow else self.idle.get(timeout=POOL_TIMEOUT)
+            except queue.Empty:
+                raise sqlite3.OperationalError(f"no database connection free after {POOL_TIMEOUT}s") from None
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        # BEGIN IMMEDIATE takes the write lock up front, for read-then-write flows
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+@st.cache_resource
+def get_pool():
+    pool = ConnectionPool(DB_FILE)
+    # bring older databases up to the current schema version once per process
+    with pool.connection() as conn:
+        migrate(conn)
+    get_snapshot_worker().request()
+    return pool
+
+# --- snapshot refresh ---
+# One background thread per process rewrites the snapshot chunks that writes
+# have dirtied. Requests that arrive while it works fold into the next pass.
+# Until a pass finishes, readers see the snapshot as stale and read SQLite.
+class SnapshotWorker:
+    def __init__(self, cache):
+        self.cache = cache
+        self.wake = threading.Event()
+        self.last = None  # (chunks written, seconds, finished at)
+        self.error = None
+        if SNAPSHOT_WORKER:
+            threading.Thread(target=self.run, name="snapshot-refresh", daemon=True).start()
+
+    def request(self):
+        self.wake.set()
+
+    def run(self):
+        while True:
+            self.wake.wait()
+            time.sleep(SNAPSHOT_DELAY)
+            self.wake.clear()
+            started = time.perf_counter()
+            try:
+                written = refresh_snapshot(DB_FILE, SNAPSHOT_DIR, clear=self.cache.clear_snapshot_marks)
+                self.last, self.error = (written, time.perf_counter() - started, time.strftime("%H:%M:%S")), None
+            except Exception as e:  # keep serving from SQLite; the next write retries
+                self.error = e
+
+@st.cache_resource
+def get_snapshot_worker():
+    return SnapshotWorker(get_cache())
+
+# --- shared data cache ---
+# One cache per server process, shared by every session and rerun. Entries are
+# dropped only when the data changes: our own write paths bump `writes`, and
+# PRAGMA data_version on a dedicated connection catches commits made by any
+# other connection (other sessions, create_database.py, sqlite3 shell).
+class DataCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.watcher = sqlite3.connect(DB_FILE, check_same_thread=False)
+        self.entries = {}
+        self.memory = {}  # table -> (raw bytes, typed bytes) of the last load
+        self.seen = None
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def version(self):
+        return (self.writes, self.watcher.execute("PRAGMA data_version").fetchone()[0])
+
+    def clear_snapshot_marks(self, dirty):
+        # on the watcher itself: a connection's own commits don't move its data_version,
+        # so dropping dirty marks, which changes no data, keeps the cached frames
+        with self.lock:
+            clear_marks(self.watcher, dirty)
+
+    def get(self, key, loader):
+        with self.lock:
+            version = self.version()
+            if version != self.seen:
+                if self.entries:
+                    self.invalidations += 1
+                self.entries.clear()
+                self.seen = version
+            if key in self.entries:
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        with timed("load", " ".join(map(str, key))):
+            value = loader()
+        with self.lock:
+            # don't keep a frame that was read while a write landed
+            if self.version() == version:
+                self.entries[key] = value
+        return value
+
+    def bump(self):
+        with self.lock:
+            self.writes += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+                    "invalidations": self.invalidations, "writes": self.writes}
+
+@st.cache_resource
+def get_cache():
+    return DataCache()
+
+def window_start(days):
+    # epoch seconds of the first midnight in a "last N days" window; None is all history
+    return None if days is None else (wall_clock_now() // DAY_SECONDS - days + 1) * DAY_SECONDS
+
+def archive_horizon():
+    # latest discharge in the archive: a window starting after it never needs the archive
+    def load():
+        with get_pool().connection() as conn:
+            return conn.execute("SELECT MAX(dod_ts) FROM patients_archive").fetchone()[0]
+    return get_cache().get(("archive_horizon",), load)
+
+def needs_archive(since):
+    # does a window starting at `since` (None = all history) reach back into the archive?
+    horizon = archive_horizon()
+    return horizon is not None and (since is None or since <= horizon)
+
+def patients_source(columns, since=None):
+    # patients as a subquery, unioned with patients_archive only when the window
+    # needs it; filters on the outer query are pushed down into both tables' indexes
+    cols = ", ".join(columns)
+    if not needs_archive(since):
+        return f"(SELECT {cols} FROM patients)"
+    return f"(SELECT {cols} FROM patients UNION ALL SELECT {cols} FROM patients_archive)"
+
+def read_table(name, columns=None, since=None):
+    # columns=None reads the whole table; otherwise only those columns, with
+    # typed dates read from their epoch columns alone. For patients, `since`
+    # keeps admissions from that epoch second on, archive included if needed.
+    schema = TABLE_SCHEMAS.get(name, {})
+    def load():
+        available = table_columns(name)
+        select = available if columns is None else [
+            f"{c}_ts" if schema.get(c) == "datetime" and f"{c}_ts" in available else c for c in columns]
+        source, where, params = name, "", ()
+        if name == "patients":
+            source = patients_source(list(dict.fromkeys([*select, "doa_ts"])), since) + " AS p"
+            if since is not None:
+                where, params = "WHERE doa_ts >= ?", (since,)
+        with get_pool().connection() as conn:
+            df = pd.read_sql_query(f"SELECT {', '.join(select)} FROM {source} {where}", conn, params=params)
+        if schema:
+            raw = df.memory_usage(deep=True).sum()
+            df = apply_schema(df, schema)
+            label = name if columns is None else f"{name} ({len(columns)} columns)"
+            get_cache().memory[label] = (raw, df.memory_usage(deep=True).sum())
+        return df if columns is None else df[list(columns)]
+    # frames are shared between sessions: callers must copy before mutating
+    return get_cache().get(("table", name, None if columns is None else tuple(columns), since), load)
+
+def read_columns(name, columns=None, since=None):
+    # The same typed columns as read_table, as an Arrow table. When the snapshot
+    # is current they are memory-mapped from it (zero-copy, shared by every
+    # process through the page cache); otherwise they come from SQLite while
+    # the background refresh catches the snapshot up.
+    tables = [name, "patients_archive"] if name == "patients" and needs_archive(since) else [name]
+    def load():
+        with get_pool().connection() as conn:
+            fresh = is_fresh(conn, tables, SNAPSHOT_DIR)
+        if fresh:
+            data = read_snapshot(SNAPSHOT_DIR, tables, columns, since)
+            if data is not None:
+                return data
+        else:
+            get_snapshot_worker().request()
+        return to_arrow(read_table(name, columns, since))
+    return get_cache().get(("columns", name, None if columns is None else tuple(columns), since), load)
+
+@contextmanager
+def transaction(immediate=False):
+    with get_pool().transaction(immediate) as conn:
+        yield conn
+    get_cache().bump()
+    get_snapshot_worker().request()
+
+class NoFreeBed(Exception):
+    pass
+
+def next_mrds(conn, n):
+    # must run inside a write transaction; the sequence never hands out a number twice
+    last = conn.execute("UPDATE sequences SET value = value + ? WHERE name = 'mrd' RETURNING value", (n,)).fetchall()[0][0]
+    return [f"MRD-{value:04d}" for value in range(last - n + 1, last + 1)]
+
+def next_mrd(conn):
+    return next_mrds(conn, 1)[0]
+
+def admit_patient(record):
+    # MRD, patient row and bed claim commit together or not at all. BEGIN IMMEDIATE
+    # serialises admissions, and the bed is claimed by a single UPDATE, so two
+    # sessions can never be handed the same bed.
+    record = normalize_record(record)
+    with transaction(immediate=True) as conn:
+        mrd = next_mrd(conn)
+        cols = ["mrd_no", *record]
+        cur = conn.execute(f"INSERT INTO patients ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                           [mrd, *record.values()])
+        sno = cur.lastrowid
+        bed = conn.execute("""
+            UPDATE beddetails SET occupied = 'YES', patient_sno = ?
+            WHERE bed_serial = (SELECT bed_serial FROM beddetails
+                                WHERE department = ? AND occupied = 'NO'
+                                ORDER BY bed_serial LIMIT 1)
+            RETURNING bed_serial
+        """, (sno, record["department"])).fetchall()
+        if not bed:
+            raise NoFreeBed(record["department"])
+    return sno, mrd, bed[0][0]
+
+# --- batch operations ---
+# Surge tooling: each batch is validated up front, then written in a single
+# transaction with executemany. Rows that can't be applied are reported and
+# skipped; the rest commit together.
+ADMIT_COLUMNS = ["name", "gender", "age", "department", "type_of_admission", *FLAG_COLUMNS, *LAB_COLUMNS]
+DISCHARGE_COLUMNS = ["sno", "outcome", "dod"]
+DISCHARGE_OUTCOMES = ["Discharged", "Deceased", "DAMA"]
+BED_COLUMNS = ["department", "beds"]
+MAX_BEDS_PER_ROW = 500
+# the choices the admission forms offer; batch rows are held to the same lists
+GENDER_OPTIONS = ["Male", "Female", "Other"]
+ADMISSION_TYPE_OPTIONS = ["Routine", "Emergency"]
+FLAG_OPTIONS = ["Yes", "No"]
+ADMIT_CHOICES = {"gender": GENDER_OPTIONS, "type_of_admission": ADMISSION_TYPE_OPTIONS,
+                 **{c: FLAG_OPTIONS for c in FLAG_COLUMNS}}
+
+def _blank(value):
+    return value is None or (isinstance(value, float) and np.isnan(value)) or str(value).strip() == ""
+
+def _report(rows):
+    return pd.DataFrame(rows, columns=["row", "status", "detail"])
+
+def admit_batch(df):
+    report, valid = [], []
+    for i, row in enumerate(df.reindex(columns=ADMIT_COLUMNS).to_dict("records"), 1):
+        rec = {c: None if _blank(v) else v for c, v in row.items()}
+        missing = [c for c in ("name", "gender", "age", "department") if rec[c] is None]
+        if missing:
+            report.append((i, "failed", f"missing {', '.join(missing)}"))
+            continue
+        try:
+            rec.update({c: parse_lab(rec[c]) for c in LAB_COLUMNS if rec[c] is not None}, age=int(float(rec["age"])))
+        except ValueError:
+            report.append((i, "failed", "age and lab values must be numbers"))
+            continue
+        # any case is accepted and stored as the form spells it
+        choices = {c: {o.lower(): o for o in options}.get(str(rec[c]).strip().lower())
+                   for c, options in ADMIT_CHOICES.items() if rec[c] is not None}
+        invalid = [c for c, value in choices.items() if value is None]
+        if invalid:
+            report.append((i, "failed", "; ".join(f"{c} must be {' / '.join(ADMIT_CHOICES[c])}" for c in invalid)))
+            continue
+        rec.update(choices)
+        rec.update(name=str(rec["name"]).strip(), department=str(rec["department"]).strip(), outcome="Admitted")
+        valid.append((i, rec))
+
+    with transaction(immediate=True) as conn:
+        # hand out free beds department by department, in bed order
+        wanted = pd.Series([rec["department"] for _, rec in valid], dtype=object).value_counts()
+        free = {dept: [r[0] for r in conn.execute(
+                    "SELECT bed_serial FROM beddetails WHERE department = ? AND occupied = 'NO' ORDER BY bed_serial LIMIT ?",
+                    (dept, int(n)))] for dept, n in wanted.items()}
+        placed = []
+        for i, rec in valid:
+            if free[rec["department"]]:
+                placed.append((i, rec, free[rec["department"]].pop(0)))
+            else:
+                report.append((i, "failed", f"no free bed in {rec['department']}"))
+        if placed:
+            now = datetime.now().isoformat()
+            records = pd.DataFrame([{**rec, "doa": now} for _, rec, _ in placed])
+            records.insert(0, "mrd_no", next_mrds(conn, len(placed)))
+            records = sql_values(normalize_dates(records))
+            last_sno = conn.execute("SELECT COALESCE(MAX(sno), 0) FROM patients").fetchone()[0]
+            cols = list(records.columns)
+            conn.executemany(f"INSERT INTO patients ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                             records.itertuples(index=False, name=None))
+            # the write lock is held, so every sno above last_sno is one of ours
+            snos = dict(conn.execute("SELECT mrd_no, sno FROM patients WHERE sno > ?", (last_sno,)).fetchall())
+            conn.executemany("UPDATE beddetails SET occupied = 'YES', patient_sno = ? WHERE bed_serial = ?",
+                             [(snos[mrd], bed) for mrd, (_, _, bed) in zip(records["mrd_no"], placed)])
+            report += [(i, "admitted", f"{mrd} (SNO {snos[mrd]}) → {bed}")
+                       for mrd, (i, _, bed) in zip(records["mrd_no"], placed)]
+    return _report(sorted(report))
+
+def discharge_batch(df):
+    report, requested = [], {}  # row -> (sno, outcome, dod)
+    for i, row in enumerate(df.reindex(columns=DISCHARGE_COLUMNS).to_dict("records"), 1):
+        outcome = "Discharged" if _blank(row["outcome"]) else str(row["outcome"]).strip()
+        outcome = next((o for o in DISCHARGE_OUTCOMES if o.lower() == outcome.lower()), None)
+        try:
+            sno = int(float(row["sno"]))
+        except (TypeError, ValueError):
+            report.append((i, "failed", "SNO must be a number"))
+            continue
+        if outcome is None:
+            report.append((i, "failed", f"outcome must be one of {', '.join(DISCHARGE_OUTCOMES)}"))
+        elif any(sno == seen for seen, _, _ in requested.values()):
+            report.append((i, "failed", f"SNO {sno} appears twice in this batch"))
+        else:
+            requested[i] = (sno, outcome, None if _blank(row["dod"]) else str(row["dod"]))
+
+    with transaction(immediate=True) as conn:
+        snos = [sno for sno, _, _ in requested.values()]
+        linked = {sno: (bed, doa) for sno, bed, doa in conn.execute(f"""
+            SELECT p.sno, b.bed_serial, p.doa FROM patients p JOIN beddetails b ON b.patient_sno = p.sno
+            WHERE p.sno IN ({', '.join('?' * len(snos))})
+        """, snos).fetchall()} if snos else {}
+        done = []
+        for i, (sno, outcome, dod) in requested.items():
+            if sno in linked:
+                bed, doa = linked[sno]
+                done.append({"row": i, "sno": sno, "bed": bed, "outcome": outcome, "doa": doa,
+                             "dod": dod or datetime.now().isoformat()})
+            else:
+                report.append((i, "failed", f"no bed linked to SNO {sno}"))
+        if done:
+            dates = sql_values(normalize_dates(pd.DataFrame(done)))
+            bad = dates["dod_ts"].isna() | (pd.to_numeric(dates["dod_ts"]) < pd.to_numeric(dates["doa_ts"]))
+            report += [(r, "failed", "discharge date is invalid or before admission") for r in dates.loc[bad, "row"]]
+            dates = dates[~bad]
+            conn.executemany("UPDATE beddetails SET occupied = 'NO', patient_sno = NULL WHERE bed_serial = ?",
+                             [(bed,) for bed in dates["bed"]])
+            conn.executemany("UPDATE patients SET outcome = ?, dod = ?, dod_ts = ?, duration_of_stay = ? WHERE sno = ?",
+                             dates[["outcome", "dod", "dod_ts", "duration_of_stay", "sno"]].itertuples(index=False, name=None))
+            report += [(r, "discharged", f"SNO {sno} ({outcome}), {bed} released")
+                       for r, sno, outcome, bed in dates[["row", "sno", "outcome", "bed"]].itertuples(index=False, name=None)]
+    return _report(sorted(report))
+
+def add_beds(df):
+    report, rows = [], []
+    df = df.reindex(columns=BED_COLUMNS)
+    with transaction(immediate=True) as conn:
+        for i, row in enumerate(df.to_dict("records"), 1):
+            try:
+                n = int(float(row["beds"]))
+            except (TypeError, ValueError):
+                n = 0
+            if _blank(row["department"]) or not 1 <= n <= MAX_BEDS_PER_ROW:
+                report.append((i, "failed", f"needs a department and 1-{MAX_BEDS_PER_ROW} beds"))
+                continue
+            dept = str(row["department"]).strip()
+            serials = reserve_bed_serials(conn, dept, n)
+            rows += [(serial, dept) for serial in serials]
+            report.append((i, "added", f"{n} bed(s) in {dept}: {serials[0]} … {serials[-1]}"))
+        conn.executemany("INSERT INTO beddetails (bed_serial, occupied, department) VALUES (?, 'NO', ?)", rows)
+    return _report(report)
+
+def batch_input(key, columns, rows=()):
+    # a CSV upload wins; otherwise rows are typed into an editable table
+    upload = st.file_uploader(f"Upload CSV ({', '.join(columns)})", type="csv", key=f"{key}_csv")
+    if upload is not None:
+        df = pd.read_csv(upload, dtype=str)
+        st.caption(f"{len(df)} row(s) from {upload.name}")
+        return df
+    return st.data_editor(pd.DataFrame(list(rows), columns=columns, dtype="string"), num_rows="dynamic",
+                          use_container_width=True, key=f"{key}_editor")
+
+def show_report(report):
+    if report.empty:
+        st.info("Nothing to apply.")
+        return
+    applied = int((report["status"] != "failed").sum())
+    (st.success if applied == len(report) else st.warning)(f"{applied} of {len(report)} row(s) applied.")
+    st.dataframe(report, use_container_width=True, hide_index=True)
 
 # --- header styles ---
 st.markdown("""
@@ -150,117 +745,604 @@ with col2:
 
 
 # --- navigation ---
-nav = st.radio("", ["Dashboard", "Department Utilization", "Patient Analytics",
+nav = st.radio("", ["Dashboard", "Department Utilization", "Patient Analytics", "Cohort Analysis",
                     "Data Filtering & Search", "Staff Tools", "Hospital Admin",
                     "About Us", "Contact Us"], horizontal=True)
+page_started = time.perf_counter()
+
+# --- page data ---
+# The columns each page works on, declared per page as {table: columns}; a page
+# or table that isn't listed is never loaded. Everything else on the pages runs
+# targeted SQL. Columns are read on first access, projected to the declared
+# ones, as Arrow tables shared through the data cache.
+ANALYTICS_COLUMNS = ["doa", "dod", "age", "gender", "department", "type_of_admission", "duration_of_stay",
+                     "outcome", "smoking", "alcohol", *LAB_COLUMNS, "anaemia", "heart_failure", "uti", "chest_infection"]
+PAGE_DATA = {
+    "Patient Analytics": {"patients": ANALYTICS_COLUMNS},
+    "Cohort Analysis": {"patients": ["department", "age", "outcome", "duration_of_stay", *FLAG_COLUMNS, *LAB_COLUMNS]},
+}
+
+class PageData:
+    def __init__(self, page):
+        self.page = page
+        self.tables = PAGE_DATA.get(page, {})
+
+    def get(self, table, since=None):
+        if table not in self.tables:
+            raise KeyError(f"{table} is not declared for {self.page!r} in PAGE_DATA")
+        return read_columns(table, self.tables[table], since)
 
-# --- load data ---
 try:
-    patients = read_table("patients")
-    beds = read_table("beddetails")
-    users = read_table("users")
+    get_pool()
 except Exception as e:
     st.error(f"Database not found or invalid. Run create_database.py first.\n\n{e}")
     st.stop()
 
 # --- helper ---
 def dept_summary():
-    df = beds.copy()
-    occ = df[df["occupied"]=="YES"].groupby("department").size().reset_index(name="occupied")
-    total = df.groupby("department").size().reset_index(name="total")
-    merged = total.merge(occ, on="department", how="left").fillna(0)
-    merged["vacant"] = merged["total"] - merged["occupied"]
-    merged["occupancy_rate"] = (merged["occupied"]/merged["total"]*100).round(1)
-    return merged
+    # one row per department, maintained by triggers on beddetails
+    def load():
+        with get_pool().connection() as conn:
+            df = pd.read_sql_query("""
+                SELECT department, total, occupied, vacant FROM department_occupancy
+                WHERE total > 0 ORDER BY department
+            """, conn)
+        df["occupancy_rate"] = (df["occupied"]/df["total"]*100).round(1)
+        return df
+    return get_cache().get(("dept_summary",), load)
+
+def census(days):
+    # admissions / discharges / deaths per day over the last `days` days, from the daily_census rollup
+    today = datetime.now().date()
+    since = today - timedelta(days=days - 1)
+    def load():
+        with get_pool().connection() as conn:
+            df = pd.read_sql_query("""
+                SELECT day, SUM(admissions) AS admissions, SUM(discharges) AS discharges, SUM(deaths) AS deaths
+                FROM daily_census WHERE day >= ? GROUP BY day
+            """, conn, params=(since.isoformat(),))
+        return df.set_index("day").reindex(pd.date_range(since, today).strftime("%Y-%m-%d"), fill_value=0)
+    return get_cache().get(("census", since, days), load)
+
+# --- live KPIs ---
+# Each session keeps its own copy of the Dashboard KPIs and per-department
+# occupancy, along with the id of the last change-feed event they include.
+# A fragment polls the events table and folds in only the events after that
+# id; the session reloads in full only when it is more than LIVE_MAX_EVENTS
+# behind, the feed was pruned past its cursor, a bulk import logged a 'reload'
+# or the day rolled over.
+def live_baseline():
+    # the totals and the feed position, read in one transaction so they agree
+    today = datetime.now().date().isoformat()
+    # both tables, whatever archive_horizon() says: the baseline must not check out a
+    # second connection mid-transaction, and an archive run could land in between
+    stays = "(SELECT duration_of_stay FROM patients UNION ALL SELECT duration_of_stay FROM patients_archive)"
+    def load():
+        with get_pool().transaction() as conn:
+            cursor = conn.execute("SELECT IFNULL(MAX(id), 0) FROM events").fetchone()[0]
+            beds = pd.read_sql_query("SELECT department, total, occupied FROM department_occupancy", conn)
+            admissions, discharges = conn.execute("""
+                SELECT IFNULL(SUM(admissions), 0), IFNULL(SUM(discharges), 0) FROM daily_census WHERE day = ?
+            """, (today,)).fetchone()
+            los_sum, los_count = conn.execute(f"""
+                SELECT IFNULL(SUM(duration_of_stay), 0), COUNT(duration_of_stay)
+                FROM {stays}
+            """).fetchone()
+        return {"cursor": cursor, "day": today, "beds": beds.set_index("department"), "admissions": admissions,
+                "discharges": discharges, "los_sum": los_sum, "los_count": los_count, "applied": 0}
+    return get_cache().get(("live_baseline", today), load)
+
+def poll_events(cursor, limit=LIVE_MAX_EVENTS + 1):
+    with get_pool().connection() as conn:
+        return pd.read_sql_query("SELECT * FROM events WHERE id > ? ORDER BY id LIMIT ?", conn,
+                                 params=(cursor, limit))
+
+def apply_events(state, events):
+    # new totals from a batch of events: the after image counts in, the before image counts out
+    day = state["day"]
+    patients, beds = events[events["kind"] != "bed"], events[events["kind"] == "bed"]
+    moved = pd.concat([
+        pd.DataFrame({"department": beds["department"], "total": 1, "occupied": beds["occupied"]}),
+        pd.DataFrame({"department": beds["old_department"], "total": -1, "occupied": -beds["old_occupied"]}),
+    ]).dropna(subset=["department"]).groupby("department")[["total", "occupied"]].sum()
+    return {
+        **state,
+        "cursor": int(events["id"].iloc[-1]),
+        "beds": state["beds"].add(moved, fill_value=0).astype(int),
+        "admissions": state["admissions"] + int((patients["doa"] == day).sum() - (patients["old_doa"] == day).sum()),
+        "discharges": state["discharges"] + int((patients["dod"] == day).sum() - (patients["old_dod"] == day).sum()),
+        "los_sum": state["los_sum"] + patients["los"].sum() - patients["old_los"].sum(),
+        "los_count": state["los_count"] + int(patients["los"].count() - patients["old_los"].count()),
+        "applied": state["applied"] + len(events),
+    }
+
+def live_kpis():
+    # this session's KPIs brought up to date with the change feed
+    state = st.session_state.get("live_kpis")
+    if state is None or state["day"] != datetime.now().date().isoformat():
+        state = live_baseline()
+    else:
+        events = poll_events(state["cursor"])
+        if (len(events) > LIVE_MAX_EVENTS or (len(events) and events["id"].iloc[0] != state["cursor"] + 1)
+                or (events["kind"] == "reload").any()):
+            state = live_baseline()  # too far behind, the events we need were pruned, or a bulk import
+        elif len(events):
+            state = apply_events(state, events)
+    st.session_state["live_kpis"] = state
+    return state
+
+# --- bed demand forecast ---
+# One length-of-stay model per process, refit from new discharges only (see
+# forecast.py). Forecasts are cached like any other frame and keyed by the hour,
+# so they follow writes and the clock but are not recomputed on every rerun.
+@st.cache_resource
+def get_los_model():
+    return LosModel()
+
+def bed_forecast(days=HORIZON_DAYS):
+    def load():
+        beds = dept_summary()[["department", "total"]]
+        beds = beds[beds["total"] > 0]
+        with get_pool().connection() as conn:
+            fc = forecast_beds(conn, get_los_model(), beds["department"].tolist(), days)
+        timeline = fc.merge(beds, on="department")
+        timeline["occupancy_%"] = (timeline["expected"] / timeline["total"] * 100).round(1)
+        return timeline, pressure(fc, beds)
+    return get_cache().get(("forecast", days, wall_clock_now() // 3600), load)
+
+# --- occupancy timeline ---
+# Beds in use per department at the end of every day or hour, rebuilt from
+# admissions and discharges rather than the beddetails snapshot. Every stay is
+# +1 in its admission bucket and -1 in its discharge bucket (open stays run to
+# now); a weighted bincount per (department, bucket) and a cumsum along time
+# give the whole timeline at once. Day-level events come straight from the
+# daily_census rollup, so only hourly views read patients, and then only the
+# window's rows, grouped in SQL: the census before the window comes from the rollup.
+BUCKETS = {"Daily": DAY_SECONDS, "Hourly": 3600}
+OCCUPANCY_PERCENTILES = [50, 90, 95]
+MAX_PLOT_POINTS = 2000  # per department; longer timelines are plotted as bucket maxima
+MAX_HOURLY_DAYS = 365   # hourly views read patients, so their window is capped
+
+def occupancy_timeline(resolution="Daily", days=None):
+    bucket = BUCKETS[resolution]
+    now = wall_clock_now()
+    start = window_start(days)
+    def load():
+        # patients_source() may check out a connection of its own, so it runs before ours
+        stays = patients_source(["department", "doa_ts", "dod_ts"], start) if bucket < DAY_SECONDS else None
+        with get_pool().connection() as conn:
+            events = pd.read_sql_query("""
+                SELECT department, day, admissions - discharges AS delta FROM daily_census
+                WHERE department != '' AND admissions != discharges
+            """, conn)
+            events["ts"] = (pd.to_datetime(events.pop("day")) - EPOCH) // pd.Timedelta(seconds=1)
+            if stays:
+                hourly = pd.read_sql_query(f"""
+                    -- grouped by time first: grouping (or filtering) on department first steers
+                    -- SQLite onto the department index and a full scan instead of the ts range
+                    SELECT department, doa_ts / :b * :b AS ts, COUNT(*) AS delta FROM {stays}
+                    WHERE doa_ts >= :start GROUP BY 2, 1
+                    UNION ALL
+                    SELECT department, dod_ts / :b * :b, -COUNT(*) FROM {stays}
+                    WHERE dod_ts >= :start GROUP BY 2, 1
+                """, conn, params={"b": bucket, "start": start or 0}).dropna(subset=["department"])
+                events = pd.concat([events[events["ts"] < (start or 0)], hourly], ignore_index=True)
+        last = now // bucket
+        if start is not None:
+            first = start // bucket
+        else:
+            first = int(events["ts"].min()) // bucket if len(events) else last
+        n = int(last - first + 1)
+        codes, departments = pd.factorize(events["department"], sort=True)
+        # everything before the window folds into its first bucket; future dates fall off the end
+        pos = np.clip(events["ts"].to_numpy(np.int64) // bucket - first, 0, n)
+        counts = np.bincount(codes * (n + 1) + pos, weights=events["delta"].to_numpy(np.float64),
+                             minlength=len(departments) * (n + 1))
+        counts = counts.reshape(len(departments), n + 1)[:, :n].cumsum(axis=1)
+        index = pd.to_datetime((first + np.arange(n)) * bucket, unit="s")
+        return pd.DataFrame(counts.T.round().astype(np.int32), index=index, columns=list(departments))
+    return get_cache().get(("occupancy", resolution, start), load)
+
+def occupancy_stats(timeline):
+    values = timeline.to_numpy()
+    stats = pd.DataFrame({"peak": values.max(axis=0), "peak_at": timeline.index[values.argmax(axis=0)],
+                          "mean": values.mean(axis=0).round(1)}, index=timeline.columns)
+    for q, col in zip(OCCUPANCY_PERCENTILES, np.percentile(values, OCCUPANCY_PERCENTILES, axis=0)):
+        stats[f"p{q}"] = col
+    return stats.rename_axis("department").reset_index()
+
+HIST_BINS = 20
+TOP_K = 15
+
+def column_distributions(since=None):
+    # per-column bin counts (numeric) or top-k counts (categorical) over the
+    # admissions since `since`, computed once per data version, chunk by chunk
+    # over the Arrow columns; charts only ever receive these aggregates
+    def load():
+        table = PageData("Patient Analytics").get("patients", since)
+        dists = {}
+        for col in table.column_names:
+            column, kind = table[col], table[col].type
+            if pa.types.is_timestamp(kind):
+                counts, edges = histogram(column, HIST_BINS)
+                dists[col] = {"kind": "datetime", "counts": counts, "edges": edges}
+            elif pa.types.is_integer(kind) or pa.types.is_floating(kind):
+                counts, edges = histogram(column, HIST_BINS)
+                dists[col] = {"kind": "numeric", "counts": counts, "edges": edges}
+            else:
+                top = top_values(column, TOP_K)
+                dists[col] = {"kind": "categorical", "labels": top.index.tolist(), "counts": top.to_numpy()}
+        return dists
+    return get_cache().get(("distributions", since), load)
+
+def fts_query(text):
+    # every word has to match as a prefix: "mrd-00 ali" -> "mrd"* "00"* "ali"*
+    return " ".join(f'"{token}"*' for token in re.findall(r"\w+", text))
+
+def search_patients(text, page=0):
+    # FTS5 match over MRD, name, department and outcome, one page at a time.
+    # Ranking has to score every hit, so the count is capped and a very broad
+    # term (e.g. "general") falls back to newest-first, which FTS5 streams.
+    match = fts_query(text)
+    if not match:
+        return pd.DataFrame(), 0
+    with get_pool().connection() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM (SELECT 1 FROM patients_fts WHERE patients_fts MATCH ? LIMIT ?)",
+                             (match, SEARCH_RANK_LIMIT + 1)).fetchone()[0]
+        ranked = total <= SEARCH_RANK_LIMIT
+        df = pd.read_sql_query(f"""
+            SELECT p.* FROM (
+                SELECT rowid, rank FROM patients_fts WHERE patients_fts MATCH ?
+                ORDER BY {"rank" if ranked else "rowid DESC"} LIMIT ? OFFSET ?
+            ) AS hit JOIN patients p ON p.sno = hit.rowid
+            ORDER BY {"hit.rank" if ranked else "p.sno DESC"}
+        """, conn, params=(match, SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE))
+    return df, total
+
+def table_columns(name):
+    def load():
+        with get_pool().connection() as conn:
+            return [row[1] for row in conn.execute(f"PRAGMA table_info({name})")]
+    return get_cache().get(("columns", name), load)
+
+def distinct_values(col):
+    # picker values for one column, read once per data version
+    def load():
+        with get_pool().connection() as conn:
+            return [row[0] for row in conn.execute(
+                f"SELECT DISTINCT {col} FROM patients WHERE {col} IS NOT NULL ORDER BY {col} LIMIT ?", (DISTINCT_LIMIT,))]
+    return get_cache().get(("distinct", col), load)
+
+def filter_clause(filters):
+    # {column: [values]} -> parameterised WHERE clause; column names are checked against the schema
+    allowed = set(table_columns("patients"))
+    parts, params = [], []
+    for col, vals in filters.items():
+        if col not in allowed:
+            raise ValueError(f"unknown column {col!r}")
+        if vals:
+            parts.append(f"{col} IN ({', '.join('?' * len(vals))})")
+            params.extend(vals)
+    return (" AND ".join(parts) or "1"), params
+
+def filtered_count(filters):
+    where, params = filter_clause(filters)
+    def load():
+        with get_pool().connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM patients WHERE {where}", params).fetchone()[0]
+    return get_cache().get(("filtered_count", where, tuple(params)), load)
+
+def filtered_page(filters, after_sno=0):
+    # keyset pagination: one page of matching rows after a given sno
+    where, params = filter_clause(filters)
+    with get_pool().connection() as conn:
+        return pd.read_sql_query(f"SELECT * FROM patients WHERE {where} AND sno > ? ORDER BY sno LIMIT ?",
+                                 conn, params=(*params, after_sno, FILTER_PAGE_SIZE))
+
+def distribution_chart(dist):
+    if dist["kind"] == "numeric":
+        edges = dist["edges"]
+        fig = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=dist["counts"], width=np.diff(edges),
+                               marker_color="#2563eb"))
+        fig.update_layout(bargap=0.02, xaxis_title="Value", yaxis_title="Count")
+    elif dist["kind"] == "datetime":
+        edges = dist["edges"]
+        fig = go.Figure(go.Bar(x=pd.to_datetime((edges[:-1] + edges[1:]) / 2, unit="s"), y=dist["counts"],
+                               width=np.diff(edges) * 1000, marker_color="#2563eb"))  # plotly widths are in ms
+        fig.update_layout(bargap=0.02, xaxis_title="Date", yaxis_title="Count")
+    else:
+        fig = go.Figure(go.Bar(x=dist["labels"], y=dist["counts"], marker_color="#0ea5e9"))
+        fig.update_layout(xaxis_title="Category", yaxis_title="Count")
+        fig.update_xaxes(type="category", categoryorder="total descending")
+    return fig
+
+# --- cohort analysis ---
+# Stratified outcomes by comorbidity combination, department and age band. Each
+# dimension becomes an integer code and the codes combine into one mixed-radix
+# group key, so a single pass of bincounts gives counts, deaths and sums for
+# every cohort. For the LOS percentiles, closed stays are sorted once by
+# (group, LOS); each group is then a contiguous run, indexed in one step.
+# Results are memoized per cohort definition in the data cache, so they are
+# recomputed only after a write.
+COHORT_DIMENSIONS = {"comorbidities": "Comorbidity combination", "department": "Department", "age_band": "Age band"}
+AGE_BANDS = [18, 40, 65, 80]
+AGE_LABELS = ["0-17", "18-39", "40-64", "65-79", "80+", "unknown"]
+LOS_PERCENTILES = [50, 90]
+MIN_COHORT = 10  # default minimum closed stays for a cohort to be listed
+
+def _cohort_codes(table, dim, flags):
+    # (integer code per row, label per code) for one stratification dimension
+    if dim == "comorbidities":
+        combo = np.zeros(table.num_rows, np.int64)
+        for bit, flag in enumerate(flags):
+            combo |= table[flag].fill_null(False).to_numpy().astype(np.int64) << bit
+        labels = [" + ".join(f for bit, f in enumerate(flags) if code >> bit & 1) or "none"
+                  for code in range(2 ** len(flags))]
+        return combo, labels
+    if dim == "department":
+        dept = table["department"].to_pandas()
+        return dept.cat.codes.to_numpy().astype(np.int64) + 1, ["(none)", *dept.cat.categories]
+    age = table["age"].to_numpy()
+    band = np.where(np.isnan(age), len(AGE_LABELS) - 1, np.digitize(np.nan_to_num(age), AGE_BANDS))
+    return band.astype(np.int64), AGE_LABELS
+
+def cohort_stats(by, flags, since=None):
+    by, flags = tuple(by), tuple(flags)
+    def load():
+        table = PageData("Cohort Analysis").get("patients", since)
+        codes = [_cohort_codes(table, dim, flags) for dim in by]
+        key = np.zeros(table.num_rows, np.int64)
+        for code, labels in codes:
+            key = key * len(labels) + code
+        groups, inverse = np.unique(key, return_inverse=True)
+        g = len(groups)
+
+        los = table["duration_of_stay"].to_numpy().astype(np.float64)
+        closed = ~np.isnan(los)
+        dead = (table["outcome"].to_pandas() == "Deceased").to_numpy()
+        patients = np.bincount(inverse, minlength=g)
+        n_closed = np.bincount(inverse, weights=closed, minlength=g).astype(np.int64)
+        deaths = np.bincount(inverse, weights=dead & closed, minlength=g).astype(np.int64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            stats = {"patients": patients, "closed": n_closed,
+                     "mortality_%": (deaths / n_closed * 100).round(1),
+                     "los_mean": (np.bincount(inverse[closed], weights=los[closed], minlength=g) / n_closed).round(2)}
+
+            # percentiles with linear interpolation over each group's sorted run
+            order = np.lexsort((los[closed], inverse[closed]))
+            ranked = los[closed][order]
+            starts = np.cumsum(n_closed) - n_closed
+            for q in LOS_PERCENTILES:
+                pos = starts + (n_closed - 1).clip(0) * q / 100
+                lo, hi = np.floor(pos).astype(np.int64), np.ceil(pos).astype(np.int64)
+                ok = n_closed > 0
+                value = np.full(g, np.nan)
+                value[ok] = ranked[lo[ok]] + (ranked[hi[ok]] - ranked[lo[ok]]) * (pos[ok] - lo[ok])
+                stats[f"los_p{q}"] = value.round(2)
+
+            for lab in LAB_COLUMNS:
+                values = table[lab].to_numpy().astype(np.float64)
+                known = ~np.isnan(values)
+                stats[f"{lab}_mean"] = (np.bincount(inverse[known], weights=values[known], minlength=g)
+                                        / np.bincount(inverse[known], minlength=g)).round(2)
+
+        # decode the group keys back into one label column per dimension
+        columns, rest = {}, groups
+        for dim, (_, labels) in reversed(list(zip(by, codes))):
+            columns[dim] = np.array(labels, dtype=object)[rest % len(labels)]
+            rest = rest // len(labels)
+        result = pd.DataFrame({**{dim: columns[dim] for dim in by}, **stats})
+        return result.sort_values("patients", ascending=False, ignore_index=True)
+    return get_cache().get(("cohort", by, flags, since), load)
 
 # === Dashboard ===
 if nav == "Dashboard":
     st.markdown("### 🏥 Hospital Overview")
-    total_beds = len(beds)
-    occ_beds = len(beds[beds.occupied=="YES"])
-    today = datetime.now().date()
+    live = st.toggle("Live updates", value=True, key="live_updates",
+                     help=f"Refresh the KPIs and occupancy every {LIVE_POLL_SECONDS}s from the change feed")
 
-    today_adm = len(patients[patients["doa"].astype(str).str.startswith(str(today))]) if "doa" in patients else 0
-    today_dis = len(patients[patients["dod"].astype(str).str.startswith(str(today))]) if "dod" in patients else 0
+    # both fragments read the same session copy; whichever runs first folds in the new events
+    @st.fragment(run_every=LIVE_POLL_SECONDS if live else None)
+    def live_overview():
+        with timed("render", "Dashboard / KPI cards"):
+            kpi = live_kpis()
+            beds = kpi["beds"][kpi["beds"]["total"] > 0]
+            avg_stay = kpi["los_sum"] / kpi["los_count"] if kpi["los_count"] else 0
 
-    c1, c2, c3, c4 = st.columns(4)
-    c1.markdown(f"<div class='metric-card'><div class='metric-label'>Total Beds</div><div class='metric-value'>{total_beds}</div></div>", unsafe_allow_html=True)
-    c2.markdown(f"<div class='metric-card'><div class='metric-label'>Total Admissions (Today)<div class='metric-value'>{today_adm}</div></div>", unsafe_allow_html=True)
-    c3.markdown(f"<div class='metric-card'><div class='metric-label'>Total Discharges (Today)<div class='metric-value'>{today_dis}</div></div>", unsafe_allow_html=True)
-    if "duration_of_stay" in patients.columns and not patients.empty:
-        avg_stay = patients["duration_of_stay"].astype(float).mean()
-    else:
-        avg_stay = 0
-    c4.markdown(f"<div class='metric-card'><div class='metric-label'>Avg. Length of Stay<div class='metric-value'>{avg_stay:.1f} days</div></div>", unsafe_allow_html=True)
+            c1, c2, c3, c4 = st.columns(4)
+            c1.markdown(f"<div class='metric-card'><div class='metric-label'>Total Beds</div><div class='metric-value'>{int(beds['total'].sum())}</div></div>", unsafe_allow_html=True)
+            c2.markdown(f"<div class='metric-card'><div class='metric-label'>Total Admissions (Today)<div class='metric-value'>{kpi['admissions']}</div></div>", unsafe_allow_html=True)
+            c3.markdown(f"<div class='metric-card'><div class='metric-label'>Total Discharges (Today)<div class='metric-value'>{kpi['discharges']}</div></div>", unsafe_allow_html=True)
+            c4.markdown(f"<div class='metric-card'><div class='metric-label'>Avg. Length of Stay<div class='metric-value'>{avg_stay:.1f} days</div></div>", unsafe_allow_html=True)
+            st.caption(f"{'Live' if live else 'Updated'} as of {time.strftime('%H:%M:%S')} · "
+                       f"change feed #{kpi['cursor']}, {kpi['applied']} event(s) applied since the last full load")
+
+    live_overview()
 
       # Charts
-    st.markdown("#### Admissions vs Discharges (Last 7 Days)")
-    if "doa" in patients.columns:
-        df = patients.copy()
-        df["doa_dt"] = pd.to_datetime(df["doa"], errors="coerce")
-        df["dod_dt"] = pd.to_datetime(df["dod"], errors="coerce")
-        days = pd.date_range(datetime.now() - pd.Timedelta(days=6), datetime.now())
-        adm = df.groupby(df["doa_dt"].dt.date).size().reindex(days.date, fill_value=0)
-        dis = df.groupby(df["dod_dt"].dt.date).size().reindex(days.date, fill_value=0)
+    window = st.selectbox("Window", [7, 30, 365], format_func=lambda d: f"Last {d} days", key="census_window")
+    st.markdown(f"#### Admissions vs Discharges (Last {window} Days)")
+    with timed("render", "Dashboard / census chart"):
+        cen = census(window)
+        days = pd.to_datetime(cen.index)
         fig = go.Figure()
-        fig.add_trace(go.Scatter(x=days, y=adm, name="Admissions", mode="lines+markers", line=dict(color="#3b82f6")))
-        fig.add_trace(go.Scatter(x=days, y=dis, name="Discharges", mode="lines+markers", line=dict(color="#10b981")))
+        fig.add_trace(go.Scatter(x=days, y=cen["admissions"], name="Admissions", mode="lines+markers", line=dict(color="#3b82f6")))
+        fig.add_trace(go.Scatter(x=days, y=cen["discharges"], name="Discharges", mode="lines+markers", line=dict(color="#10b981")))
         st.plotly_chart(fig, use_container_width=True, key="chart1")
 
-    st.markdown("#### Department Occupancy Overview")
-    du = dept_summary()
-    fig2 = px.pie(du, values="occupied", names="department", title="Current Department Occupancy")
-    st.plotly_chart(fig2, use_container_width=True, key="chart2")
+    @st.fragment(run_every=LIVE_POLL_SECONDS if live else None)
+    def live_occupancy():
+        st.markdown("#### Department Occupancy Overview")
+        with timed("render", "Dashboard / occupancy chart"):
+            beds = live_kpis()["beds"]
+            fig2 = px.pie(beds[beds["total"] > 0].reset_index(), values="occupied", names="department",
+                          title="Current Department Occupancy")
+            st.plotly_chart(fig2, use_container_width=True, key="chart2")
+
+    live_occupancy()
+
+    st.markdown("#### 🔮 Bed Demand Forecast")
+    horizon = st.selectbox("Horizon", [7, HORIZON_DAYS, 30], index=1, format_func=lambda d: f"Next {d} days",
+                           key="forecast_days")
+    with timed("render", "Dashboard / bed forecast"):
+        fc, outlook = bed_forecast(horizon)
+        if outlook.empty:
+            st.info("No departments with beds to forecast.")
+        else:
+            fig3 = go.Figure()
+            for dept, rows in fc.groupby("department", sort=False):
+                fig3.add_trace(go.Scatter(x=rows["date"], y=rows["occupancy_%"], name=dept, mode="lines",
+                                          customdata=rows[["expected", "low", "high", "total"]],
+                                          hovertemplate="%{y}% · %{customdata[0]} of %{customdata[3]} beds "
+                                                        "(%{customdata[1]}-%{customdata[2]})"))
+            fig3.add_hline(y=100, line_dash="dash", line_color="#ef4444")
+            fig3.update_layout(yaxis_title="Expected occupancy (%)")
+            st.plotly_chart(fig3, use_container_width=True, key="chart_forecast")
+            at_risk = outlook[outlook["at_risk_from"].notna()]
+            if len(at_risk):
+                st.warning("⚠️ Projected to run out of beds: " + ", ".join(
+                    f"{r.department} (from {r.at_risk_from:%d %b})" for r in at_risk.itertuples()))
+            st.caption(f"Expected beds in use, from current inpatients and admissions by weekday over the last "
+                       f"{ARRIVAL_WEEKS} weeks, with length of stay from the last {LOS_HISTORY_DAYS} days of discharges. "
+                       f"'at_risk_from' is the first day the 90th percentile reaches the department's beds.")
+            st.dataframe(outlook, use_container_width=True, hide_index=True)
 
 # ========================
 # 2️⃣ DEPARTMENT UTILIZATION
 # ========================
 elif nav == "Department Utilization":
     st.markdown("### 🧭 Department Utilization Summary")
-    du = dept_summary()
-    st.dataframe(du, use_container_width=True)
-    fig = px.bar(du, x="department", y="occupancy_rate", color="department", text="occupancy_rate")
-    st.plotly_chart(fig, use_container_width=True, key="chart3")
+    with timed("render", "Department Utilization / summary"):
+        du = dept_summary()
+        st.dataframe(du, use_container_width=True)
+        fig = px.bar(du, x="department", y="occupancy_rate", color="department", text="occupancy_rate")
+        st.plotly_chart(fig, use_container_width=True, key="chart3")
+
+    st.markdown("#### 📈 Occupancy History")
+    o1, o2 = st.columns(2)
+    span = o1.selectbox("Window", [30, 90, 365, 1825, None], index=2, key="occupancy_window",
+                        format_func=lambda d: "All history" if d is None else f"Last {d} days")
+    resolution = o2.radio("Resolution", list(BUCKETS), horizontal=True, key="occupancy_resolution")
+    if resolution == "Hourly" and (span is None or span > MAX_HOURLY_DAYS):
+        st.caption(f"Hourly resolution covers the last {MAX_HOURLY_DAYS} days at most.")
+        span = MAX_HOURLY_DAYS
+    with timed("render", "Department Utilization / occupancy history"):
+        timeline = occupancy_timeline(resolution, span)
+        if timeline.empty:
+            st.info("No admissions recorded in this window.")
+        else:
+            stats = occupancy_stats(timeline).merge(du[["department", "total"]].rename(columns={"total": "beds"}),
+                                                    on="department", how="left")
+            stats["peak_use_%"] = (stats["peak"] / stats["beds"] * 100).round(1)
+            st.dataframe(stats, use_container_width=True, hide_index=True)
+            # long timelines are thinned to bucket maxima so peaks survive the downsampling
+            step = -(-len(timeline) // MAX_PLOT_POINTS)
+            shown = timeline.groupby(np.arange(len(timeline)) // step).max().set_index(timeline.index[::step])
+            fig = px.line(shown, labels={"index": "", "value": "Beds occupied", "variable": "Department"})
+            st.plotly_chart(fig, use_container_width=True, key="chart_occupancy")
 
 # ========================
 # 3️⃣ PATIENT ANALYTICS
 # ========================
 elif nav == "Patient Analytics":
-    st.markdown("### 👩‍⚕️ Patient Analytics (All Columns Visualized)")
-    for i, col in enumerate(patients.columns):
+    st.markdown("### 👩‍⚕️ Patient Analytics")
+    # windows inside the archive horizon never read patients_archive
+    span = st.selectbox("Admitted in", [90, 365, 1825, None], index=3, key="analytics_window",
+                        format_func=lambda d: "All history" if d is None else f"Last {d} days")
+    dists = column_distributions(window_start(span))
+    # only the chosen columns are drawn; each chart ships bin counts, not rows
+    chosen = st.multiselect("Columns to visualize", list(dists), default=list(dists)[:2], key="analytics_cols")
+    for col in chosen:
         st.markdown(f"#### 📊 {col}")
-        series = patients[col].dropna()
-        if pd.api.types.is_numeric_dtype(series):
-            fig = px.histogram(patients, x=col, nbins=20, color_discrete_sequence=["#2563eb"])
-        else:
-            counts = series.value_counts().head(15)
-            dfc = pd.DataFrame({"Category": counts.index.astype(str), "Count": counts.values})
-            fig = px.bar(dfc, x="Category", y="Count", color_discrete_sequence=["#0ea5e9"])
-            fig.update_xaxes(categoryorder="total descending")
-        st.plotly_chart(fig, use_container_width=True, key=f"chart_{i}")
+        with timed("render", "Patient Analytics / distribution chart"):
+            st.plotly_chart(distribution_chart(dists[col]), use_container_width=True, key=f"chart_{col}")
+
+
+# === Cohort Analysis ===
+elif nav == "Cohort Analysis":
+    st.markdown("### 🧬 Cohort Analysis")
+    k1, k2 = st.columns(2)
+    span = k1.selectbox("Admitted in", [90, 365, 1825, None], index=3, key="cohort_window",
+                        format_func=lambda d: "All history" if d is None else f"Last {d} days")
+    by = k2.multiselect("Stratify by", list(COHORT_DIMENSIONS), default=["comorbidities"], key="cohort_by",
+                        format_func=COHORT_DIMENSIONS.get)
+    flags = st.multiselect("Comorbidities in the combination", FLAG_COLUMNS, default=["anaemia", "heart_failure"],
+                           key="cohort_flags")
+    min_size = st.number_input("Minimum closed stays per cohort", 1, 10_000, MIN_COHORT, key="cohort_min")
+    since = window_start(span)
+    with timed("render", "Cohort Analysis / stratified table"):
+        stats = cohort_stats(by, flags, since)
+        shown = stats[stats["closed"] >= min_size]
+        st.caption(f"{len(shown)} of {len(stats)} cohort(s) with at least {min_size} closed stay(s) · "
+                   f"LOS in days, mortality over closed stays")
+        st.dataframe(shown, use_container_width=True, hide_index=True)
+
+    if len(by) >= 2:
+        st.markdown("#### Cross-tab")
+        x1, x2, x3 = st.columns(3)
+        rows = x1.selectbox("Rows", by, index=0, key="crosstab_rows", format_func=COHORT_DIMENSIONS.get)
+        cols = x2.selectbox("Columns", [d for d in by if d != rows], key="crosstab_cols", format_func=COHORT_DIMENSIONS.get)
+        metric = x3.selectbox("Value", ["mortality_%", "los_mean", "los_p50", "los_p90", "patients"], key="crosstab_metric")
+        with timed("render", "Cohort Analysis / cross-tab"):
+            pair = cohort_stats([rows, cols], flags, since)
+            pair = pair[pair["closed"] >= min_size]
+            table = pair.pivot(index=rows, columns=cols, values=metric)
+            st.dataframe(table, use_container_width=True)
+            fig = px.imshow(table, text_auto=True, aspect="auto", color_continuous_scale="Blues")
+            st.plotly_chart(fig, use_container_width=True, key="chart_crosstab")
 
 
 # === Data Filtering & Search ===
 elif nav == "Data Filtering & Search":
     st.markdown("### 🔍 Data Filtering and Search")
-    key = st.text_input("Search by MRD, SNO, or Department")
+    key = st.text_input("Search by MRD, SNO, Name, Department or Outcome")
     if st.button("Search"):
-        df = patients.copy()
-        if key:
-            result = df[
-                (df["mrd_no"].astype(str).str.contains(key, case=False, na=False)) |
-                (df["sno"].astype(str).str.contains(key, case=False, na=False)) |
-                (df["department"].astype(str).str.contains(key, case=False, na=False)) if "department" in df.columns else False
-            ]
-            st.dataframe(result if not result.empty else pd.DataFrame(["No match found"], columns=["Message"]))
+        st.session_state.search = {"key": key, "page": 0}
+    search = st.session_state.get("search")
+    if search and search["key"]:
+        started = time.perf_counter()
+        with timed("render", "Search / text search"):
+            result, total = search_patients(search["key"], search["page"])
+        if search["key"].strip().isdigit():
+            # an SNO is not part of the text index; show an exact hit first
+            with get_pool().connection() as conn:
+                by_sno = pd.read_sql_query("SELECT * FROM patients WHERE sno=?", conn, params=(int(search["key"]),))
+            result = pd.concat([by_sno, result[~result["sno"].isin(by_sno["sno"])]]) if not result.empty else by_sno
+        elapsed = (time.perf_counter() - started) * 1000
+        pages = max(1, -(-total // SEARCH_PAGE_SIZE))
+        if total > SEARCH_RANK_LIMIT:
+            st.caption(f"{SEARCH_RANK_LIMIT}+ matches, newest first · page {search['page'] + 1} · {elapsed:.1f} ms")
+        else:
+            st.caption(f"{total} match(es) · page {search['page'] + 1} of {pages} · {elapsed:.1f} ms")
+        st.dataframe(result if not result.empty else pd.DataFrame(["No match found"], columns=["Message"]))
+        p1, p2, _ = st.columns([1, 1, 6])
+        if p1.button("◀ Prev", disabled=search["page"] == 0, key="search_prev"):
+            search["page"] -= 1
+            st.rerun()
+        if p2.button("Next ▶", disabled=search["page"] + 1 >= pages, key="search_next"):
+            search["page"] += 1
+            st.rerun()
     st.markdown("#### Advanced Column Filters")
-    if not patients.empty:
-        cols = st.multiselect("Select columns to filter", patients.columns.tolist())
-        query = patients.copy()
-        for c in cols:
-            vals = st.multiselect(f"Select values for {c}", sorted(patients[c].dropna().unique().tolist()))
-            if vals: query = query[query[c].isin(vals)]
-        st.dataframe(query, use_container_width=True)
+    cols = st.multiselect("Select columns to filter", table_columns("patients"))
+    filters = {c: st.multiselect(f"Select values for {c}", distinct_values(c)) for c in cols}
+    # page cursors: the sno each visited page starts after; reset whenever the filters change
+    signature = repr(sorted(filters.items()))
+    if st.session_state.get("filter_signature") != signature:
+        st.session_state.filter_signature = signature
+        st.session_state.filter_cursors = [0]
+    cursors = st.session_state.filter_cursors
+    with timed("render", "Search / filtered page"):
+        total = filtered_count(filters)
+        page = filtered_page(filters, cursors[-1])
+        st.caption(f"{total} matching patient(s) · page {len(cursors)} of {max(1, -(-total // FILTER_PAGE_SIZE))}")
+        st.dataframe(page, use_container_width=True)
+    f1, f2, _ = st.columns([1, 1, 6])
+    if f1.button("◀ Prev", disabled=len(cursors) == 1, key="filter_prev"):
+        cursors.pop()
+        st.rerun()
+    if f2.button("Next ▶", disabled=len(page) < FILTER_PAGE_SIZE or len(cursors) * FILTER_PAGE_SIZE >= total, key="filter_next"):
+        cursors.append(int(page["sno"].iloc[-1]))
+        st.rerun()
 
 elif nav == "Staff Tools":
 
@@ -271,23 +1353,22 @@ elif nav == "Staff Tools":
     st.markdown("<div class='section-title'>➕ Add New Patient</div>", unsafe_allow_html=True)
     with st.form("add_patient_form"):
         name = st.text_input("Patient Name *")
-        gender = st.selectbox("Gender *", ["Male","Female","Other"])
+        gender = st.selectbox("Gender *", GENDER_OPTIONS)
         age = st.number_input("Age *", 0, 120, 30)
         dept = st.text_input("Department *", value="General")
-        doa = datetime.now().strftime("%Y-%m-%d")
 
         # Optional Medical Details
         with st.expander("🩺 Additional Details (Optional)"):
-            smoking = st.selectbox("Smoking", ["Yes","No",""])
-            alcohol = st.selectbox("Alcohol", ["Yes","No",""])
+            smoking = st.selectbox("Smoking", [*FLAG_OPTIONS, ""])
+            alcohol = st.selectbox("Alcohol", [*FLAG_OPTIONS, ""])
             hb = st.text_input("HB")
             tlc = st.text_input("TLC")
             platelets = st.text_input("Platelets")
             glucose = st.text_input("Glucose")
-            anaemia = st.selectbox("Anaemia", ["Yes","No",""])
-            heart_failure = st.selectbox("Heart Failure", ["Yes","No",""])
-            uti = st.selectbox("UTI", ["Yes","No",""])
-            chest_infection = st.selectbox("Chest Infection", ["Yes","No",""])
+            anaemia = st.selectbox("Anaemia", [*FLAG_OPTIONS, ""])
+            heart_failure = st.selectbox("Heart Failure", [*FLAG_OPTIONS, ""])
+            uti = st.selectbox("UTI", [*FLAG_OPTIONS, ""])
+            chest_infection = st.selectbox("Chest Infection", [*FLAG_OPTIONS, ""])
 
         add_btn = st.form_submit_button("Add Patient")
 
@@ -295,29 +1376,19 @@ elif nav == "Staff Tools":
         if not name or not dept or not gender or age <= 0:
             st.error("❌ Please fill in all mandatory fields (Name, Age, Gender, Department).")
         else:
-            free = beds[(beds["department"] == dept) & (beds["occupied"] == "NO")]
-            if free.empty:
-                st.error("❌ No empty bed available in this department!")
-            else:
-                mrd = generate_mrd()
-                bed_id = free.iloc[0]["bed_serial"]
-                doa_time = datetime.now().isoformat()
-
-                exec_sql("""
-                    INSERT INTO patients 
-                    (mrd_no, doa, gender, age, department, outcome, smoking, alcohol, hb, tlc, platelets, glucose, anaemia, heart_failure, uti, chest_infection)
-                    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                """, (mrd, doa_time, gender, age, dept, "Admitted", smoking, alcohol, hb, tlc, platelets, glucose, anaemia, heart_failure, uti, chest_infection))
-
-                conn = get_conn()
-                cur = conn.cursor()
-                cur.execute("SELECT sno FROM patients WHERE mrd_no=?", (mrd,))
-                sno = cur.fetchone()[0]
-                conn.close()
-
-                exec_sql("UPDATE beddetails SET occupied='YES', patient_sno=? WHERE bed_serial=?", (sno, bed_id))
-
+            try:
+                sno, mrd, bed_id = admit_patient({
+                    "doa": datetime.now().isoformat(), "name": name, "gender": gender, "age": age,
+                    "department": dept, "outcome": "Admitted", "smoking": smoking, "alcohol": alcohol,
+                    "hb": parse_lab(hb), "tlc": parse_lab(tlc), "platelets": parse_lab(platelets),
+                    "glucose": parse_lab(glucose), "anaemia": anaemia,
+                    "heart_failure": heart_failure, "uti": uti, "chest_infection": chest_infection,
+                })
                 st.success(f"✅ Patient {name} added (MRD: {mrd}) and assigned to {bed_id}")
+            except NoFreeBed:
+                st.error("❌ No empty bed available in this department!")
+            except ValueError:
+                st.error("❌ HB, TLC, Platelets and Glucose must be numbers.")
 
     # --- Discharge / Edit Patient Section ---
     st.markdown("#### 🏥 Discharge or Edit Patient")
@@ -325,18 +1396,28 @@ elif nav == "Staff Tools":
     sno = st.number_input("Enter Patient SNO", 1)
 
     if st.button("Discharge"):
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT bed_serial FROM beddetails WHERE patient_sno=?", (sno,))
-        row = cur.fetchone()
-
-        if row:
-            exec_sql("UPDATE beddetails SET occupied='NO', patient_sno=NULL WHERE bed_serial=?", (row[0],))
-            exec_sql("UPDATE patients SET outcome='Discharged', dod=? WHERE sno=?", (datetime.now().isoformat(), sno))
+        report = discharge_batch(pd.DataFrame([{"sno": sno}]))
+        if report["status"].iloc[0] == "discharged":
             st.success("🟢 Patient discharged successfully and bed released!")
         else:
             st.warning("⚠️ No bed linked to this patient")
 
+    # --- Batch Operations Section ---
+    st.markdown("<div class='section-title'>📋 Batch Admissions & Discharges</div>", unsafe_allow_html=True)
+    admit_tab, discharge_tab = st.tabs(["Admit", "Discharge"])
+    with admit_tab:
+        st.caption("Required: name, gender, age, department. Every row that gets a free bed is admitted in one transaction. "
+                   f"gender is {' / '.join(GENDER_OPTIONS)}, type_of_admission {' / '.join(ADMISSION_TYPE_OPTIONS)}, "
+                   f"flags {' / '.join(FLAG_OPTIONS)}.")
+        batch = batch_input("batch_admit", ADMIT_COLUMNS)
+        if st.button("Admit Batch", key="admit_batch_btn"):
+            show_report(admit_batch(batch.dropna(how="all")))
+    with discharge_tab:
+        st.caption(f"outcome defaults to Discharged ({' / '.join(DISCHARGE_OUTCOMES)}), dod to now.")
+        batch = batch_input("batch_discharge", DISCHARGE_COLUMNS)
+        if st.button("Discharge Batch", key="discharge_batch_btn"):
+            show_report(discharge_batch(batch.dropna(how="all")))
+
 
 # === Hospital Admin ===
 elif nav == "Hospital Admin":
@@ -347,26 +1428,20 @@ elif nav == "Hospital Admin":
 
         # ----------- ADD EXTRA BEDS -----------
         st.markdown("#### ➕ Add Extra Beds")
-        dept = st.text_input("Department", "General", key="add_bed_dept")
-        n = st.number_input("Beds to Add", 1, 100, 1, key="add_bed_n")
+        st.caption("One row per department; serials continue each department's BED-XXX-nnn numbering.")
+        batch = batch_input("add_beds", BED_COLUMNS, [("General", "1")])
         if st.button("Add Beds", key="add_beds_btn"):
-            conn = get_conn(); cur = conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM beddetails")
-            base = cur.fetchone()[0]
-            for i in range(n):
-                bed_serial = f"BED-{base + i + 1:04d}"
-                cur.execute("INSERT INTO beddetails (bed_serial, occupied, department) VALUES (?, 'NO', ?)", (bed_serial, dept))
-            conn.commit(); conn.close()
-            st.success(f"✅ Added {n} new beds to {dept} department.")
+            show_report(add_beds(batch.dropna(how="all")))
 
         # ----------- EDIT PATIENT DETAILS -----------
         st.markdown("#### 🩺 Edit Patient Details")
         sno = st.number_input("Patient SNO to Edit", 1, key="admin_edit_sno")
         if st.button("Load Details", key="load_patient_btn"):
-            import pandas as pd
-            conn = get_conn()
-            patient_df = pd.read_sql_query(f"SELECT * FROM patients WHERE sno={sno}", conn)
-            conn.close()
+            st.session_state["admin_edit_loaded"] = sno
+        # the form stays up on later reruns (Save included) until another SNO is picked
+        if st.session_state.get("admin_edit_loaded") == sno:
+            with get_pool().connection() as conn:
+                patient_df = pd.read_sql_query("SELECT * FROM patients WHERE sno=?", conn, params=(sno,))
 
             if not patient_df.empty:
                 patient_data = patient_df.iloc[0].to_dict()
@@ -388,47 +1463,36 @@ elif nav == "Hospital Admin":
                     for field in editable_fields:
                         val = patient_data.get(field,"")
                         if field in ["hb","tlc","platelets","glucose"]:
-                            updated_values[field] = st.number_input(field.upper(), value=float(val) if val else 0.0, key=f"admin_{field}")
+                            updated_values[field] = st.number_input(field.upper(), value=float(val) if val else 0.0, key=f"admin_{field}_{sno}")
                         elif field in ["smoking","alcohol","anaemia","heart_failure","uti","chest_infection"]:
-                            updated_values[field] = st.selectbox(field.replace("_"," ").title(), ["","Yes","No"], index=["","Yes","No"].index(val) if val in ["Yes","No"] else 0, key=f"admin_{field}")
+                            updated_values[field] = st.selectbox(field.replace("_"," ").title(), ["","Yes","No"], index=["","Yes","No"].index(val) if val in ["Yes","No"] else 0, key=f"admin_{field}_{sno}")
                         elif field == "department":
-                            updated_values[field] = st.selectbox("Department", ["General","ICU","Pediatrics","Maternity","Surgery"], index=["General","ICU","Pediatrics","Maternity","Surgery"].index(val) if val in ["General","ICU","Pediatrics","Maternity","Surgery"] else 0)
+                            updated_values[field] = st.selectbox("Department", ["General","ICU","Pediatrics","Maternity","Surgery"], index=["General","ICU","Pediatrics","Maternity","Surgery"].index(val) if val in ["General","ICU","Pediatrics","Maternity","Surgery"] else 0, key=f"admin_department_{sno}")
                         elif field == "type_of_admission":
-                            updated_values[field] = st.selectbox("Type of Admission", ["Routine","Emergency"], index=["Routine","Emergency"].index(val) if val in ["Routine","Emergency"] else 0)
+                            updated_values[field] = st.selectbox("Type of Admission", ADMISSION_TYPE_OPTIONS, index=ADMISSION_TYPE_OPTIONS.index(val) if val in ADMISSION_TYPE_OPTIONS else 0, key=f"admin_type_of_admission_{sno}")
                         elif field == "outcome":
-                            updated_values[field] = st.selectbox("Outcome", ["Admitted","Discharged","Deceased"], index=["Admitted","Discharged","Deceased"].index(val) if val in ["Admitted","Discharged","Deceased"] else 0)
+                            updated_values[field] = st.selectbox("Outcome", ["Admitted","Discharged","Deceased"], index=["Admitted","Discharged","Deceased"].index(val) if val in ["Admitted","Discharged","Deceased"] else 0, key=f"admin_outcome_{sno}")
                         else:  # dod
-                            updated_values[field] = st.text_input("Date of Discharge (DOD)", value=val, key=f"admin_{field}")
+                            updated_values[field] = st.text_input("Date of Discharge (DOD)", value=val, key=f"admin_{field}_{sno}")
 
                     save = st.form_submit_button("Save Changes", key="admin_save_changes")
 
                     if save:
                         try:
-                            conn = get_conn(); cur = conn.cursor()
-                            # Update patients table
-                            set_clause = ", ".join([f"{col}=?" for col in updated_values])
-                            values = [updated_values[col] for col in updated_values]
-                            values.append(sno)
-                            cur.execute(f"UPDATE patients SET {set_clause} WHERE sno=?", values)
-                            conn.commit()
-
-                            # Update beddetails if department changed
-                            if updated_values.get("department") != patient_data.get("department"):
-                                cur.execute("UPDATE beddetails SET department=? WHERE patient_sno=?", (updated_values["department"], sno))
-                                conn.commit()
-
-                            # Recalculate duration_of_stay
-                            if updated_values.get("dod") and patient_data.get("doa"):
-                                try:
-                                    doa = datetime.strptime(patient_data["doa"], "%Y-%m-%d")
-                                    dod = datetime.strptime(updated_values["dod"], "%Y-%m-%d")
-                                    duration = (dod - doa).days
-                                    cur.execute("UPDATE patients SET duration_of_stay=? WHERE sno=?", (duration, sno))
-                                    conn.commit()
-                                except:
-                                    pass
-
-                            conn.close()
+                            # dod, dod_ts and duration_of_stay come out of the shared date normaliser
+                            values = normalize_record({**updated_values, "doa": patient_data.get("doa")})
+                            del values["doa"], values["doa_ts"]  # DOA is locked
+                            if updated_values.get("dod") and values["dod_ts"] is None:
+                                raise ValueError(f"unrecognised discharge date {updated_values['dod']!r}")
+                            with transaction() as conn:
+                                # Update patients table
+                                set_clause = ", ".join([f"{col}=?" for col in values])
+                                conn.execute(f"UPDATE patients SET {set_clause} WHERE sno=?", [*values.values(), sno])
+
+                                # Update beddetails if department changed
+                                if updated_values.get("department") != patient_data.get("department"):
+                                    conn.execute("UPDATE beddetails SET department=? WHERE patient_sno=?", (updated_values["department"], sno))
+
                             st.success("✅ Patient record updated successfully!")
 
                         except Exception as e:
@@ -436,6 +1500,74 @@ elif nav == "Hospital Admin":
             else:
                 st.warning("⚠️ Patient not found.")
 
+        # ----------- OCCUPANCY SUMMARY CHECK -----------
+        st.markdown("#### 🧮 Occupancy Summary Check")
+        if st.button("Check & Repair", key="check_occupancy_btn"):
+            with transaction(immediate=True) as conn:
+                drift = check_department_occupancy(conn)
+            if drift:
+                st.warning(f"⚠️ Rebuilt department_occupancy, {len(drift)} department(s) had drifted.")
+                st.dataframe(pd.DataFrame(drift), use_container_width=True)
+            else:
+                st.success("✅ department_occupancy matches beddetails.")
+
+        # ----------- ARCHIVE -----------
+        st.markdown("#### 🗄️ Archive Closed Encounters")
+        older = st.number_input("Closed more than (days) ago", 30, 3650, ARCHIVE_AFTER_DAYS, key="archive_days")
+        if st.button("Archive", key="archive_btn"):
+            with get_pool().connection() as conn:
+                moved = archive_closed(conn, older)
+            get_cache().bump()
+            st.success(f"✅ Moved {moved} encounter(s) to patients_archive.")
+        with get_pool().connection() as conn:
+            live, archived = conn.execute(
+                "SELECT (SELECT COUNT(*) FROM patients), (SELECT COUNT(*) FROM patients_archive)").fetchone()
+        st.caption(f"{live} live patient record(s), {archived} archived.")
+
+        # ----------- DATA CACHE -----------
+        st.markdown("#### ⚡ Data Cache")
+        cs = get_cache().stats()
+        k1, k2, k3, k4 = st.columns(4)
+        k1.metric("Cached Frames", cs["entries"])
+        k2.metric("Hits / Misses", f"{cs['hits']} / {cs['misses']}")
+        k3.metric("Hit Rate", f"{cs['hit_rate']}%")
+        k4.metric("Invalidations", cs["invalidations"])
+        for table, (raw, typed) in get_cache().memory.items():
+            st.caption(f"{table} frame: {raw / 1e6:.1f} MB as loaded → {typed / 1e6:.1f} MB typed "
+                       f"({raw / max(typed, 1):.1f}x smaller)")
+        worker = get_snapshot_worker()
+        with get_pool().connection() as conn:
+            pending = conn.execute("SELECT COUNT(*) FROM snapshot_dirty").fetchone()[0]
+        status = f"{pending} chunk(s) waiting to be rewritten"
+        if worker.last:
+            status += f" · last refresh {worker.last[2]}: {worker.last[0]} chunk(s) in {worker.last[1]:.1f}s"
+        st.caption(f"Columnar snapshot ({SNAPSHOT_DIR}): {status}")
+        if worker.error:
+            st.warning(f"⚠️ Snapshot refresh failed, analytics are reading SQLite: {worker.error}")
+        model = get_los_model()
+        st.caption(f"Forecast model: {model.stays():,} settled discharge(s) in its length-of-stay curves, "
+                   f"{model.refits} refit(s) this process")
+
+        # ----------- PERFORMANCE -----------
+        st.markdown("#### ⏱️ Performance")
+        if not INSTRUMENT:
+            st.info("Instrumentation is off (SMARTCARE_INSTRUMENT=0).")
+        else:
+            perf = get_metrics().summary()
+            kinds = st.multiselect("Show", ["page", "render", "load", "sql"], default=["page", "render", "load", "sql"],
+                                   key="perf_kinds")
+            st.caption(f"Rolling percentiles over the last {METRIC_WINDOW} samples per operation, slowest p95 first.")
+            st.dataframe(perf[perf["kind"].isin(kinds)], use_container_width=True, hide_index=True)
+            st.markdown(f"##### 🐢 Slow operations (≥ {SLOW_MS:.0f} ms, also written to {SLOW_LOG})")
+            slow = get_metrics().slow_ops()
+            if slow.empty:
+                st.caption("Nothing slow recorded yet.")
+            else:
+                st.dataframe(slow, use_container_width=True, hide_index=True)
+            if st.button("Reset Metrics", key="reset_metrics_btn"):
+                get_metrics().reset()
+                st.rerun()
+
     elif pwd:
         st.error("❌ Incorrect password.")
 
@@ -453,4 +1585,8 @@ elif nav == "Contact Us":
         m = st.text_area("Message")
         s = st.form_submit_button("Send Message")
     if s:
-        st.success("Message sent (Demo Mode).")
\ No newline at end of file
+        st.success("Message sent (Demo Mode).")
+
+# --- page timing ---
+if INSTRUMENT:
+    get_metrics().record("page", nav, (time.perf_counter() - page_started) * 1000)
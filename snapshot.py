@@ -0,0 +1,211 @@
+# snapshot.py
+# Columnar copy of patients, patients_archive and beddetails for the analytics
+# pages. Each table is written already typed as Arrow IPC files of
+# SNAPSHOT_CHUNK snos next to the database. Readers memory-map the files, so
+# the column buffers are used in place, and every session and server process
+# shares one copy in the OS page cache. Triggers record in snapshot_dirty which
+# chunks a write touched, and refresh() rewrites only those.
+#   python snapshot.py            # bring the snapshot up to date
+#   python snapshot.py --rebuild  # rewrite every chunk
+import sqlite3
+import argparse
+import glob
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from create_database import DB_FILE, FLAG_COLUMNS, LAB_COLUMNS, SNAPSHOT_CHUNK, SEED_SNAPSHOT_SQL
+
+BUSY_TIMEOUT = 10
+
+def snapshot_dir(db=DB_FILE):
+    return os.environ.get("SMARTCARE_SNAPSHOT", f"{db}.snapshot")
+
+# --- column types ---
+# How each patients column is held once loaded: low-cardinality text as
+# category, Yes/No flags as nullable boolean, labs as float32 and dates as
+# datetime64 (taken from the canonical epoch columns, which are then dropped).
+PATIENT_SCHEMA = {
+    "sno": "int32",
+    "age": "Int16",
+    "gender": "category",
+    "department": "category",
+    "type_of_admission": "category",
+    "outcome": "category",
+    "duration_of_stay": "float32",
+    **{c: "boolean" for c in FLAG_COLUMNS},
+    **{c: "float32" for c in LAB_COLUMNS},
+    "doa": "datetime",
+    "dod": "datetime",
+}
+TABLE_SCHEMAS = {"patients": PATIENT_SCHEMA, "patients_archive": PATIENT_SCHEMA}
+FLAG_VALUES = {"Yes": True, "No": False, "1": True, "0": False}
+
+def apply_schema(df, schema):
+    df = df.copy()
+    for col, kind in schema.items():
+        if col not in df and f"{col}_ts" not in df:
+            continue
+        if kind == "datetime":
+            ts = df.pop(f"{col}_ts") if f"{col}_ts" in df else None
+            df[col] = (pd.to_datetime(ts, unit="s") if ts is not None
+                       else pd.to_datetime(df[col], errors="coerce")).astype("datetime64[s]")
+        elif kind == "boolean":
+            df[col] = df[col].astype("string").map(FLAG_VALUES).astype("boolean")
+        elif kind in ("float32", "int32", "Int16"):
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(kind)
+        else:
+            df[col] = df[col].astype(kind)
+    return df
+
+def _arrow_column(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return pa.array(series.astype(object), type=pa.string(), from_pandas=True).dictionary_encode()
+    if series.dtype.kind == "f":
+        # NaN stays a value, so no validity bitmap: these columns read back zero-copy
+        return pa.array(series.to_numpy())
+    if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+        return pa.array(series.astype(object), type=pa.string(), from_pandas=True)
+    return pa.array(series, from_pandas=True)  # boolean, Int16, int32, datetime64[s]
+
+def to_arrow(df):
+    # a typed frame as an Arrow table; the same column always gets the same
+    # Arrow type, whatever values a chunk happens to hold
+    return pa.table({col: _arrow_column(df[col]) for col in df.columns})
+
+# --- column access ---
+# Aggregates over (possibly chunked) Arrow columns, one chunk at a time, so a
+# memory-mapped column is never copied into one contiguous array.
+def chunk_values(chunk):
+    # numbers as numpy (nulls -> NaN), dates as epoch seconds; a view when the chunk has no nulls
+    if pa.types.is_timestamp(chunk.type):
+        chunk = chunk.cast(pa.int64())
+    return chunk.to_numpy(zero_copy_only=False)
+
+def histogram(column, bins):
+    chunks = [chunk_values(c).astype(np.float64, copy=False) for c in column.chunks]
+    chunks = [c for c in chunks if len(c) and not np.isnan(c).all()]
+    if not chunks:
+        return np.zeros(0, int), np.zeros(1)
+    lo = min(np.nanmin(c) for c in chunks)
+    hi = max(np.nanmax(c) for c in chunks)
+    edges = np.histogram_bin_edges([lo, hi], bins=bins)
+    # NaN falls outside every bin, so the per-chunk counts skip it
+    return sum(np.histogram(c, bins=edges)[0] for c in chunks), edges
+
+def top_values(column, k):
+    counts = pc.value_counts(column)
+    series = pd.Series(counts.field("counts").to_numpy(), index=counts.field("values").to_pylist())
+    series = series[series.index.notna()]
+    series.index = series.index.map(str)
+    return series.groupby(level=0).sum().sort_values(ascending=False, kind="stable").head(k)
+
+# --- refresh ---
+def chunk_path(root, table, chunk):
+    return os.path.join(root, table, f"{chunk:06d}.arrow")
+
+def write_chunk(root, table, chunk, df):
+    path = chunk_path(root, table, chunk)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if df.empty:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    data = to_arrow(df)
+    # written aside and renamed in: a reader maps either the old file or the new one
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, data.schema) as writer:
+        writer.write_table(data)
+    os.replace(tmp, path)
+
+def _snapshot_id(conn):
+    return conn.execute("SELECT value FROM sequences WHERE name = 'snapshot'").fetchone()[0]
+
+def _manifest(root):
+    try:
+        with open(os.path.join(root, "manifest")) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+def clear_marks(conn, dirty):
+    # a chunk written to again since we read it keeps its mark (its gen moved on)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany("DELETE FROM snapshot_dirty WHERE tbl = ? AND chunk = ? AND gen = ?", dirty)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def refresh(db=DB_FILE, root=None, rebuild=False, clear=None):
+    # rewrites every dirty chunk and returns how many were written; `clear` drops the
+    # marks of the chunks written, by default with clear_marks() on our own connection
+    root = root or snapshot_dir(db)
+    conn = sqlite3.connect(db, timeout=BUSY_TIMEOUT, isolation_level=None)
+    try:
+        # a missing directory, or one written for another database, starts over
+        if rebuild or _manifest(root) != _snapshot_id(conn):
+            shutil.rmtree(root, ignore_errors=True)
+            os.makedirs(root)
+            conn.execute(SEED_SNAPSHOT_SQL)
+            with open(os.path.join(root, "manifest"), "w") as f:
+                f.write(str(_snapshot_id(conn)))
+
+        # the dirty list and the rows are read in one transaction, so they agree
+        conn.execute("BEGIN")
+        dirty = conn.execute("SELECT tbl, chunk, gen FROM snapshot_dirty").fetchall()
+        for table, chunk, gen in dirty:
+            if table == "beddetails":
+                df = pd.read_sql_query("SELECT * FROM beddetails", conn)
+            else:
+                df = pd.read_sql_query(f"SELECT * FROM {table} WHERE sno >= ? AND sno < ?", conn,
+                                       params=(chunk * SNAPSHOT_CHUNK, (chunk + 1) * SNAPSHOT_CHUNK))
+            write_chunk(root, table, chunk, apply_schema(df, TABLE_SCHEMAS.get(table, {})))
+        conn.execute("COMMIT")
+
+        if clear is None:
+            clear_marks(conn, dirty)
+        else:
+            clear(dirty)
+        return len(dirty)
+    finally:
+        conn.close()
+
+# --- read ---
+def is_fresh(conn, tables, root):
+    # the snapshot stands in for these tables only when it belongs to this
+    # database and none of their chunks is waiting to be rewritten
+    marks = ", ".join("?" * len(tables))
+    pending = conn.execute(f"SELECT 1 FROM snapshot_dirty WHERE tbl IN ({marks}) LIMIT 1", tables).fetchone()
+    return pending is None and _manifest(root) == _snapshot_id(conn)
+
+def read(root, tables, columns=None, since=None):
+    # memory-mapped tables, one record batch per chunk file; `since` keeps admissions from that epoch second on
+    parts = []
+    for table in tables:
+        for path in sorted(glob.glob(os.path.join(root, table, "*.arrow"))):
+            part = pa.ipc.open_file(pa.memory_map(path)).read_all()
+            if since is not None:
+                part = part.filter(pc.greater_equal(part["doa"], pa.scalar(since, pa.timestamp("s"))))
+            parts.append(part.select(columns) if columns is not None else part)
+    return pa.concat_tables(parts) if parts else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bring the columnar analytics snapshot up to date.")
+    parser.add_argument("--db", default=DB_FILE)
+    parser.add_argument("--rebuild", action="store_true", help="rewrite every chunk")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    written = refresh(args.db, rebuild=args.rebuild)
+    print(f"✅ Wrote {written} chunk(s) to {snapshot_dir(args.db)} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()